@@ -0,0 +1,225 @@
+"""
+Fragment cache for the emitters.
+
+Handlers with `fragment_cache` set get the constructed
+form of their model instances (the dict `Emitter.construct`
+builds for each of them) kept in the Django cache, so
+objects that don't change often aren't serialized over
+and over again.
+
+All fragments of one object live under a single cache
+key, as a dict of fragment id -> fragment. The fragment
+id covers the handler, the fields, anonymity and the
+emitter, so invalidating an object on `post_save` and
+`post_delete` is a single `cache.delete`.
+
+Only the object itself is watched: a fragment including
+related objects isn't invalidated when those change. Set
+`fragment_cache` to a timeout (in seconds) to bound that.
+
+Handlers with `response_cache` set get whole responses
+cached by `Resource` (see `cached_response`.) Those are
+invalidated through a version kept for each model, which
+changes whenever an instance is saved or deleted and is
+part of the key of every response depending on it. With
+`conditional` set, the same versions give the ETag and
+Last-Modified of the handler's responses.
+"""
+import re, time
+
+try:
+    import hashlib
+    md5 = hashlib.md5
+except ImportError:
+    import md5 as _md5 # 2.4
+    md5 = _md5.new
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.encoding import smart_str
+from django.utils.text import compress_string
+
+# Models whose instances have fragments, see `watch`.
+WATCHED = set()
+# Models with a version, see `track`.
+TRACKED = set()
+
+def concrete_model(model):
+    """
+    Proxies (including deferred classes) share the
+    fragments of the model they stand in for.
+    """
+    while model._meta.proxy:
+        model = model._meta.proxy_for_model
+
+    return model
+
+def fragment_key(model, pk):
+    """
+    Cache key for the fragments of the `model` with `pk`.
+    """
+    return 'piston:fragment:%s:%s' % (concrete_model(model)._meta,
+                                      md5(smart_str(pk)).hexdigest())
+
+def digest(*parts):
+    return md5(smart_str(repr(parts))).hexdigest()
+
+fragment_id = digest
+
+def watch(model):
+    """
+    Invalidate the fragments of `model` instances when
+    they're saved or deleted.
+    """
+    WATCHED.add(concrete_model(model))
+
+def track(model):
+    """
+    Keep a version for `model`, changing whenever one
+    of its instances is saved or deleted.
+    """
+    TRACKED.add(concrete_model(model))
+
+def invalidate(sender, instance, **kwargs):
+    model = concrete_model(sender)
+
+    if model in WATCHED:
+        cache.delete(fragment_key(model, instance.pk))
+
+    if model in TRACKED:
+        touch(model)
+
+post_save.connect(invalidate, dispatch_uid='piston.caching.invalidate')
+post_delete.connect(invalidate, dispatch_uid='piston.caching.invalidate')
+
+def timeout(handler):
+    """
+    The timeout `handler.fragment_cache` asks for (`None`
+    for the cache's default.)
+    """
+    value = getattr(handler, 'fragment_cache', None)
+
+    if value is True:
+        return None
+
+    return value
+
+def version_key(model):
+    return 'piston:version:%s' % concrete_model(model)._meta
+
+def version_timeout():
+    return getattr(settings, 'PISTON_VERSION_TIMEOUT', 60 * 60 * 24 * 30)
+
+def touch(model):
+    """
+    Gives `model` a new version, invalidating everything
+    cached on the old one. This is what saving or deleting
+    an instance does, but it can be called by hand when
+    the data behind a model changes some other way (bulk
+    `update()`, raw SQL, etc.)
+    """
+    cache.set(version_key(model), time.time(), version_timeout())
+
+def handler_models(handler):
+    """
+    The models whose versions the responses of `handler`
+    depend on: its `model` and whatever it lists in
+    `depends_on`.
+    """
+    models = list(getattr(handler, 'depends_on', ()))
+    model = getattr(handler, 'model', None)
+
+    if model is not None:
+        models.insert(0, model)
+
+    return models
+
+def model_versions(models):
+    """
+    Returns the current versions of `models`. A version
+    is the time of the last change that was seen; one that
+    got evicted from the cache starts over at the current
+    time, so anything cached on it is dropped.
+    """
+    keys = [ version_key(model) for model in models ]
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            now = time.time()
+            cache.add(key, now, version_timeout())
+            versions[key] = cache.get(key) or now
+
+    return [ versions[key] for key in keys ]
+
+_accepts_gzip = re.compile(r'\bgzip\b')
+
+def response_key(*parts):
+    return 'piston:response:%s' % digest(*parts)
+
+def cached_response(key, handler, request):
+    """
+    Returns the response cached under `key`, or `None` if
+    there is none or it's to be generated again.
+
+    A response is fresh for `handler.response_cache`
+    seconds. After that, and for another
+    `handler.response_cache_stale` seconds, the first request
+    to come along regenerates it, while the others keep
+    getting the stale one.
+    """
+    entry = cache.get(key)
+
+    if entry is None:
+        return None
+
+    if time.time() - entry['created'] >= handler.response_cache:
+        lock_timeout = getattr(settings, 'PISTON_RESPONSE_CACHE_LOCK_TIMEOUT', 30)
+
+        if cache.add(key + ':lock', 1, lock_timeout):
+            return None
+
+    content = entry['content']
+    gzipped = entry['gzip'] is not None and \
+        _accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+    if gzipped:
+        content = entry['gzip']
+
+    resp = HttpResponse(content, status=entry['status'])
+
+    for header, value in entry['headers']:
+        resp[header] = value
+
+    if gzipped:
+        resp['Content-Encoding'] = 'gzip'
+
+    if entry['gzip'] is not None:
+        patch_vary_headers(resp, ('Accept-Encoding',))
+
+    resp.streaming = False
+    return resp
+
+def cache_response(key, handler, response):
+    """
+    Stores `response` for `cached_response`, along with
+    a gzipped copy if `handler.response_cache_gzip` is set.
+    """
+    content = response.content
+    gzipped = None
+
+    if handler.response_cache_gzip:
+        gzipped = compress_string(content)
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+    entry = { 'content': content, 'gzip': gzipped, 'created': time.time(),
+              'status': response.status_code,
+              'headers': [ v for k, v in response._headers.iteritems()
+                           if k != 'vary' ] }
+
+    timeout = handler.response_cache + (handler.response_cache_stale or 0)
+    cache.set(key, entry, int(timeout))
+    cache.delete(key + ':lock')
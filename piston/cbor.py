@@ -0,0 +1,392 @@
+"""
+CBOR (RFC 7049) encoding and decoding, in pure Python.
+
+Besides what JSON has, the encoder deals natively with:
+
+ - datetimes: tag 1 (seconds since the epoch.) Naive
+   datetimes are taken to be in `settings.TIME_ZONE`,
+   like everywhere else in Piston.
+ - dates: tag 1004 (RFC 8943 full-date string.)
+ - decimals: tag 4 (decimal fraction.)
+ - byte strings: `bytearray` and `buffer`, and `str`
+   that isn't valid UTF-8 (other `str` is text.)
+
+The decoder only builds plain data (dicts, lists, strings,
+numbers, datetimes and decimals), whatever tags the input
+has, and raises `CBORDecodeError` (a `ValueError`) on
+malformed or truncated input rather than trusting the
+lengths it declares.
+"""
+import struct, datetime, decimal, calendar
+
+import pytz
+
+from datetimes import local_timezone
+
+class CBORDecodeError(ValueError):
+    pass
+
+# Major types.
+(UINT, NEGINT, BYTES, TEXT, ARRAY, MAP, TAG, SIMPLE) = range(8)
+
+BREAK = '\xff'
+INDEFINITE_ARRAY = '\x9f'
+
+def head(major, n):
+    """
+    The initial byte(s) of an item of type `major` with
+    argument (value or length) `n`.
+    """
+    major <<= 5
+
+    if n < 24:
+        return chr(major | n)
+    elif n < 0x100:
+        return struct.pack('>BB', major | 24, n)
+    elif n < 0x10000:
+        return struct.pack('>BH', major | 25, n)
+    elif n < 0x100000000:
+        return struct.pack('>BI', major | 26, n)
+
+    return struct.pack('>BQ', major | 27, n)
+
+def encode_int(value, out):
+    if 0 <= value < 0x10000000000000000:
+        out.append(head(UINT, value))
+    elif -0x10000000000000000 <= value < 0:
+        out.append(head(NEGINT, -1 - value))
+    else:
+        # Bignums, tags 2 and 3.
+        tag, value = value >= 0 and (2, value) or (3, -1 - value)
+        digits = '%x' % value
+        out.append(head(TAG, tag))
+        encode_bytes(('0' * (len(digits) % 2) + digits).decode('hex'), out)
+
+def encode_float(value, out):
+    out.append(struct.pack('>Bd', 0xfb, value))
+
+def encode_bytes(value, out):
+    value = str(value)
+    out.append(head(BYTES, len(value)))
+    out.append(value)
+
+def encode_text(value, out):
+    value = value.encode('utf-8')
+    out.append(head(TEXT, len(value)))
+    out.append(value)
+
+def encode_str(value, out):
+    try:
+        value.decode('utf-8')
+    except UnicodeDecodeError:
+        return encode_bytes(value, out)
+
+    out.append(head(TEXT, len(value)))
+    out.append(value)
+
+def encode_array(value, out):
+    if not isinstance(value, (list, tuple)):
+        value = list(value)
+
+    out.append(head(ARRAY, len(value)))
+
+    for item in value:
+        encode(item, out)
+
+def encode_map(value, out):
+    out.append(head(MAP, len(value)))
+
+    for key, item in value.iteritems():
+        encode(key, out)
+        encode(item, out)
+
+def encode_bool(value, out):
+    out.append(value and '\xf5' or '\xf4')
+
+def encode_none(value, out):
+    out.append('\xf6')
+
+def encode_datetime(value, out):
+    if value.tzinfo is not None and value.utcoffset() is not None:
+        value = value.astimezone(pytz.utc).replace(tzinfo=None)
+    else:
+        value = local_timezone().to_utc(value)
+
+    seconds = calendar.timegm(value.utctimetuple())
+    out.append(head(TAG, 1))
+
+    if value.microsecond:
+        encode_float(seconds + value.microsecond / 1e6, out)
+    else:
+        encode_int(seconds, out)
+
+def encode_date(value, out):
+    out.append(head(TAG, 1004))
+    encode_str(value.isoformat(), out)
+
+def encode_time(value, out):
+    encode_str(value.isoformat(), out)
+
+def encode_decimal(value, out):
+    sign, digits, exponent = value.as_tuple()
+
+    if not isinstance(exponent, (int, long)):
+        # Infinities and NaNs.
+        return encode_float(float(value), out)
+
+    mantissa = int(''.join(map(str, digits)) or '0')
+
+    out.append(head(TAG, 4))
+    out.append(head(ARRAY, 2))
+    encode_int(exponent, out)
+    encode_int(sign and -mantissa or mantissa, out)
+
+ENCODERS = {
+    int: encode_int,
+    long: encode_int,
+    float: encode_float,
+    bool: encode_bool,
+    type(None): encode_none,
+    unicode: encode_text,
+    str: encode_str,
+    bytearray: encode_bytes,
+    buffer: encode_bytes,
+    list: encode_array,
+    tuple: encode_array,
+    set: encode_array,
+    dict: encode_map,
+    datetime.datetime: encode_datetime,
+    datetime.date: encode_date,
+    datetime.time: encode_time,
+    decimal.Decimal: encode_decimal,
+}
+
+def encode(value, out):
+    """
+    Appends the encoding of `value` to the list `out`.
+    """
+    encoder = ENCODERS.get(type(value))
+
+    if encoder is None:
+        for klass in type(value).__mro__:
+            if klass in ENCODERS:
+                encoder = ENCODERS[type(value)] = ENCODERS[klass]
+                break
+        else:
+            raise TypeError("%r is not CBOR serializable" % (value,))
+
+    encoder(value, out)
+
+def dumps(value):
+    out = [ ]
+    encode(value, out)
+    return ''.join(out)
+
+class Decoder(object):
+    """
+    Decodes one item from `data`, refusing to nest deeper
+    than `max_depth`.
+    """
+    def __init__(self, data, max_depth=256):
+        self.data = data
+        self.pos = 0
+        self.max_depth = max_depth
+
+    def read(self, n):
+        end = self.pos + n
+
+        if end > len(self.data):
+            raise CBORDecodeError("Unexpected end of data")
+
+        data, self.pos = self.data[self.pos:end], end
+        return data
+
+    def argument(self, info):
+        if info < 24:
+            return info
+        elif info == 24:
+            return ord(self.read(1))
+        elif info == 25:
+            return struct.unpack('>H', self.read(2))[0]
+        elif info == 26:
+            return struct.unpack('>I', self.read(4))[0]
+        elif info == 27:
+            return struct.unpack('>Q', self.read(8))[0]
+        elif info == 31:
+            return None
+
+        raise CBORDecodeError("Invalid additional information %d" % info)
+
+    def decode(self, depth=0):
+        if depth > self.max_depth:
+            raise CBORDecodeError("Maximum nesting depth exceeded")
+
+        initial = ord(self.read(1))
+        major, info = initial >> 5, initial & 0x1f
+
+        if major == SIMPLE:
+            return self.simple(info)
+
+        n = self.argument(info)
+
+        if n is None and major in (UINT, NEGINT):
+            raise CBORDecodeError("Indefinite length integer")
+
+        if major == UINT:
+            return n
+        elif major == NEGINT:
+            return -1 - n
+        elif major in (BYTES, TEXT):
+            if n is None:
+                value = ''.join(self.chunks(major))
+            else:
+                value = self.read(n)
+
+            if major == TEXT:
+                try:
+                    return value.decode('utf-8')
+                except UnicodeDecodeError:
+                    raise CBORDecodeError("Invalid UTF-8 in text string")
+
+            return value
+        elif major == ARRAY:
+            if n is None:
+                return list(self.items(depth))
+
+            return [ self.decode(depth + 1) for i in xrange(self.count(n)) ]
+        elif major == MAP:
+            if n is None:
+                items = list(self.items(depth))
+
+                if len(items) % 2:
+                    raise CBORDecodeError("Map without a value for its last key")
+            else:
+                items = [ self.decode(depth + 1) for i in xrange(2 * self.count(n)) ]
+
+            try:
+                return dict(zip(items[::2], items[1::2]))
+            except TypeError:
+                raise CBORDecodeError("Unhashable map key")
+        elif major == TAG:
+            if n is None:
+                raise CBORDecodeError("Indefinite length tag")
+
+            return self.tagged(n, self.decode(depth + 1))
+
+    def count(self, n):
+        # Every item takes at least one byte.
+        if n > len(self.data) - self.pos:
+            raise CBORDecodeError("Unexpected end of data")
+
+        return n
+
+    def items(self, depth):
+        while True:
+            if self.data[self.pos:self.pos + 1] == BREAK:
+                self.pos += 1
+                return
+
+            yield self.decode(depth + 1)
+
+    def chunks(self, major):
+        while True:
+            if self.data[self.pos:self.pos + 1] == BREAK:
+                self.pos += 1
+                return
+
+            initial = ord(self.read(1))
+            n = self.argument(initial & 0x1f)
+
+            if initial >> 5 != major or n is None:
+                raise CBORDecodeError("Invalid chunk in indefinite length string")
+
+            yield self.read(n)
+
+    def simple(self, info):
+        if info == 20:
+            return False
+        elif info == 21:
+            return True
+        elif info in (22, 23):
+            return None
+        elif info == 25:
+            return half_float(struct.unpack('>H', self.read(2))[0])
+        elif info == 26:
+            return struct.unpack('>f', self.read(4))[0]
+        elif info == 27:
+            return struct.unpack('>d', self.read(8))[0]
+        elif info < 24:
+            return None
+        elif info == 24:
+            self.read(1)
+            return None
+
+        raise CBORDecodeError("Unexpected break or reserved value")
+
+    def tagged(self, tag, value):
+        try:
+            if tag == 0 and isinstance(value, unicode):
+                return parse_datetime(value)
+            elif tag == 1 and isinstance(value, (int, long, float)):
+                return datetime.datetime.fromtimestamp(value, pytz.utc)
+            elif tag in (2, 3) and isinstance(value, str):
+                n = value and int(value.encode('hex'), 16) or 0
+                return tag == 2 and n or -1 - n
+            elif tag == 4 and isinstance(value, list) and len(value) == 2:
+                exponent, mantissa = value
+                digits = tuple(map(int, str(abs(mantissa))))
+                return decimal.Decimal((int(mantissa < 0), digits, exponent))
+            elif tag == 1004 and isinstance(value, unicode):
+                return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        except (TypeError, ValueError, OverflowError, decimal.InvalidOperation):
+            raise CBORDecodeError("Invalid value for tag %d" % tag)
+
+        # Anything else is passed on untagged.
+        return value
+
+def half_float(bits):
+    exponent, fraction = (bits >> 10) & 0x1f, bits & 0x3ff
+
+    if exponent == 0:
+        value = fraction * 2 ** -24
+    elif exponent == 0x1f:
+        value = fraction and float('nan') or float('inf')
+    else:
+        value = (fraction + 1024) * 2 ** (exponent - 25)
+
+    value = float(value)
+
+    if bits & 0x8000:
+        return -value
+
+    return value
+
+def parse_datetime(value):
+    value = value.replace('Z', '+00:00')
+    offset = datetime.timedelta(0)
+
+    if value[-6:-5] in ('+', '-') and value[-3:-2] == ':':
+        sign = value[-6] == '-' and -1 or 1
+        offset = sign * datetime.timedelta(hours=int(value[-5:-3]), minutes=int(value[-2:]))
+        value = value[:-6]
+
+    if '.' in value:
+        value, fraction = value.split('.', 1)
+        microsecond = int((fraction + '000000')[:6])
+    else:
+        microsecond = 0
+
+    dt = datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
+    return (dt.replace(microsecond=microsecond) - offset).replace(tzinfo=pytz.utc)
+
+def loads(data):
+    """
+    Decodes the single CBOR item making up `data`.
+    """
+    decoder = Decoder(data)
+    value = decoder.decode()
+
+    if decoder.pos != len(data):
+        raise CBORDecodeError("Extra data after CBOR item")
+
+    return value
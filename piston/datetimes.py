@@ -0,0 +1,141 @@
+"""
+Datetime serialization for the emitters.
+
+Naive datetimes are taken to be in `settings.TIME_ZONE`
+and are converted to UTC before being formatted. Rather
+than going through `pytz` (`localize`, `astimezone` and
+`strftime`) for every single value, the UTC offsets of
+the zone are worked out once per transition period, and
+formatting is plain string interpolation.
+"""
+import bisect, datetime
+
+import pytz
+
+from django.conf import settings
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+class LocalTimezone(object):
+    """
+    Converts naive datetimes in `tz` to naive UTC ones.
+
+    Keeps the transition periods of the zone (in local
+    time) sorted, so finding the offset for a datetime
+    is a bisection. Datetimes that are ambiguous or don't
+    exist in local time (around DST changes) are left to
+    `pytz`, so they come out the way `localize` has them.
+    """
+    def __init__(self, tz):
+        self.tz = tz
+        self.fixed = None
+        self.starts = [ ]
+        self.ends = [ ]
+        self.offsets = [ ]
+
+        transitions = getattr(tz, '_utc_transition_times', None)
+        info = getattr(tz, '_transition_info', None)
+
+        if not transitions or not info:
+            self.fixed = tz.localize(datetime.datetime(2000, 1, 1)).utcoffset()
+            return
+
+        for i, utc in enumerate(transitions):
+            offset = info[i][0]
+
+            if i + 1 < len(transitions):
+                end = self.shift(transitions[i + 1], offset)
+            else:
+                end = datetime.datetime.max
+
+            self.starts.append(self.shift(utc, offset))
+            self.ends.append(end)
+            self.offsets.append(offset)
+
+    @staticmethod
+    def shift(dt, offset):
+        try:
+            return dt + offset
+        except OverflowError:
+            if offset < datetime.timedelta(0):
+                return datetime.datetime.min
+            return datetime.datetime.max
+
+    def to_utc(self, dt):
+        if self.fixed is not None:
+            return dt - self.fixed
+
+        i = bisect.bisect_right(self.starts, dt) - 1
+
+        if i >= 0 and dt < self.ends[i] and (i == 0 or dt >= self.ends[i - 1]):
+            return dt - self.offsets[i]
+
+        return self.tz.localize(dt).astimezone(pytz.utc).replace(tzinfo=None)
+
+_timezones = { }
+
+def local_timezone():
+    """
+    Returns the (cached) `LocalTimezone` for `settings.TIME_ZONE`.
+    """
+    name = settings.TIME_ZONE
+    tz = _timezones.get(name)
+
+    if tz is None:
+        tz = _timezones[name] = LocalTimezone(pytz.timezone(name))
+
+    return tz
+
+def format_piston(utc):
+    # Same as strftime("%Y-%m-%d %H:%M:%S %z") on a UTC datetime.
+    return '%04d-%02d-%02d %02d:%02d:%02d +0000' % (utc.year, utc.month,
+        utc.day, utc.hour, utc.minute, utc.second)
+
+def format_iso8601(utc):
+    if utc.microsecond:
+        return '%04d-%02d-%02dT%02d:%02d:%02d.%06dZ' % (utc.year, utc.month,
+            utc.day, utc.hour, utc.minute, utc.second, utc.microsecond)
+
+    return '%04d-%02d-%02dT%02d:%02d:%02dZ' % (utc.year, utc.month,
+        utc.day, utc.hour, utc.minute, utc.second)
+
+def format_epoch_millis(utc):
+    delta = utc - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+FORMATS = {
+    'piston': format_piston,
+    'iso8601': format_iso8601,
+    'epoch_millis': format_epoch_millis,
+}
+
+def register_format(name, formatter):
+    """
+    Register a datetime format. `formatter` gets a naive
+    UTC datetime and returns what should be emitted.
+    """
+    FORMATS[name] = formatter
+
+def datetime_encoder(format=None):
+    """
+    Returns a function serializing datetimes in `format`
+    (one of `FORMATS`, defaults to `PISTON_DATETIME_FORMAT`
+    or 'piston', which is "2010-01-31 12:00:00 +0000".)
+    """
+    if format is None:
+        format = getattr(settings, 'PISTON_DATETIME_FORMAT', 'piston')
+
+    try:
+        formatter = FORMATS[format]
+    except KeyError:
+        raise ValueError("No datetime format called %s" % format)
+
+    to_utc = local_timezone().to_utc
+
+    def encode(dt):
+        if dt.tzinfo is not None and dt.utcoffset() is not None:
+            return formatter(dt.astimezone(pytz.utc).replace(tzinfo=None))
+
+        return formatter(to_utc(dt))
+
+    return encode
@@ -1,8 +1,8 @@
 from __future__ import generators
 
-import decimal, re, inspect, time, datetime
+import decimal, re, inspect, time, datetime, types, operator, weakref
+import itertools, csv, array, struct, sys
 import copy
-import pytz
 
 from django.conf import settings
 
@@ -23,17 +23,24 @@ except NameError:
                 return True
         return False
 
-from django.db.models.query import QuerySet
+from django.db.models.query import QuerySet, ValuesQuerySet
+from django.db.models.fields.related import (SingleRelatedObjectDescriptor,
+    ReverseSingleRelatedObjectDescriptor, ForeignRelatedObjectsDescriptor,
+    ManyRelatedObjectsDescriptor, ReverseManyRelatedObjectsDescriptor)
 from django.db.models import Model, permalink
-from django.utils import simplejson
 from django.utils.xmlutils import SimplerXMLGenerator
-from django.utils.encoding import smart_unicode
+from django.utils.encoding import smart_unicode, smart_str
 from django.core.urlresolvers import reverse, NoReverseMatch
-from django.core.serializers.json import DateTimeAwareJSONEncoder
 from django.http import HttpResponse
 from django.core import serializers
-
-from utils import HttpStatusCode, Mimer
+from django.core.cache import cache
+
+from utils import HttpStatusCode, Mimer, MimerDataException
+from datetimes import datetime_encoder
+from uritemplates import expand as expand_uri
+import json_backends
+import caching
+import cbor
 from validate_jsonp import is_valid_jsonp_callback_value
 
 try:
@@ -49,6 +56,229 @@ except ImportError:
 # Allow people to change the reverser (default `permalink`).
 reverser = permalink
 
+def build_uri(url_id, args):
+    """
+    Returns the URL for what `resource_uri` returned. With
+    the default reverser, this goes through a compiled URL
+    template rather than a full `reverse` when it can.
+    """
+    if reverser is permalink:
+        url = expand_uri(url_id, args)
+
+        if url is not None:
+            return url
+
+    return reverser( lambda: (url_id, args) )()
+
+# What `Emitter.construct` does with a value, see `Emitter.resolve_type`.
+(PRIMITIVE, UNICODE, MODEL, DICT, LIST, QUERYSET, NAMEDTUPLE, DATETIME,
+ DECIMAL, RESPONSE, FUNCTION, EMITTABLE, RELATED_MANAGER, CUSTOM) = range(14)
+
+# Types `smart_unicode` leaves alone anyway.
+PRIMITIVE_TYPES = (unicode, int, long, float, type(None),
+                   datetime.date, datetime.time)
+
+_arg_names = weakref.WeakKeyDictionary()
+
+def arg_names(func):
+    """
+    `inspect.getargspec(func)[0]`, cached per function.
+    """
+    key = getattr(func, 'im_func', func)
+
+    try:
+        return _arg_names[key]
+    except (KeyError, TypeError):
+        pass
+
+    names = inspect.getargspec(func)[0]
+
+    try:
+        _arg_names[key] = names
+    except TypeError:
+        pass
+
+    return names
+
+def freeze_fields(fields):
+    """
+    Turns a `fields` spec (which may be made of lists)
+    into nested tuples, so it can be used as a cache key.
+    """
+    if isinstance(fields, (list, tuple)):
+        return tuple([ freeze_fields(f) for f in fields ])
+    return fields
+
+class FieldPlan(object):
+    """
+    Serialization plan for the instances of one model
+    class, as seen through a handler and/or a `fields`
+    spec. Figuring out which attributes to emit (`fields`,
+    `exclude` and its regexes, method fields, relations)
+    only depends on the class, so it is done once here,
+    and `Emitter.construct` just walks the result for
+    every instance.
+
+    Plans are cached process-wide in `PLANS`, see
+    `Emitter.get_plan`. Past `PISTON_PLAN_CACHE_SIZE`
+    plans (default 1000) the cache starts over, so specs
+    coming from clients (`?fields=`) can't grow it forever.
+    """
+    PLANS = { }
+
+    # Kinds of the "remainder" fields in `rest`.
+    NESTED, METHOD, CALL, CALL_REQUEST, ATTR = range(5)
+
+    def __init__(self, emitter, model, klass, handler, uri_handler, fields):
+        self.model = model
+        self.handler = handler
+        self.uri_handler = uri_handler
+        self.fields = fields
+        self.plain = not (handler or fields)
+        self.attrs = [ ]
+        self.fks = [ ]
+        self.m2m = [ ]
+        self.rest = [ ]
+        self.absolute_uri = False
+        self.api_url = hasattr(model, 'get_api_url')
+        # By anonymity, since that decides on the handlers of
+        # related models, see `Emitter.related_lookups` and
+        # `Emitter.required_columns`.
+        self.lookups = { }
+        self.columns = { }
+        self.values_ok = True
+        self.fragment_cache = False
+        self.fragment_timeout = None
+
+        if self.plain:
+            self.attrs = [ f.attname for f in klass._meta.fields ]
+            self.class_attrs = set(dir(model) + self.attrs)
+        else:
+            self.compile(emitter, klass)
+
+        # Anything depending on the request can't be shared.
+        if getattr(handler, 'fragment_cache', False) and \
+                self.CALL_REQUEST not in [ kind for kind, name, extra in self.rest ]:
+            self.fragment_cache = True
+            self.fragment_timeout = caching.timeout(handler)
+            caching.watch(model)
+
+    def compile(self, emitter, klass):
+        handler = self.handler
+        meta = klass._meta
+
+        if not self.fields and handler:
+            """
+            Fields was not specified, try to find teh correct
+            version in the typemapper we were sent.
+            """
+            get_fields = set(freeze_fields(handler.fields))
+            exclude_fields = set(handler.exclude).difference(get_fields)
+
+            if not get_fields:
+                get_fields = set([ f.attname.replace("_id", "", 1)
+                    for f in meta.fields + meta.virtual_fields ])
+
+            if hasattr(handler, 'extra_fields'):
+                get_fields.update(freeze_fields(handler.extra_fields))
+
+            # sets can be negated.
+            for exclude in exclude_fields:
+                if isinstance(exclude, basestring):
+                    get_fields.discard(exclude)
+
+                elif isinstance(exclude, re._pattern_type):
+                    for field in get_fields.copy():
+                        if exclude.match(field):
+                            get_fields.discard(field)
+
+        else:
+            get_fields = set(self.fields)
+
+        if 'absolute_uri' in get_fields:
+            self.absolute_uri = hasattr(self.model, 'get_absolute_url')
+
+        met_fields = emitter.method_fields(handler, get_fields)
+
+        for f in meta.local_fields + meta.virtual_fields:
+            if f.serialize and not any([ p in met_fields for p in [ f.attname, f.name ]]):
+                if not f.rel:
+                    if f.attname in get_fields:
+                        self.attrs.append(f.attname)
+                        get_fields.remove(f.attname)
+                else:
+                    if f.attname[:-3] in get_fields:
+                        self.attrs.append(f.name)
+                        self.fks.append(f)
+                        get_fields.remove(f.name)
+
+        for mf in meta.many_to_many:
+            if mf.serialize and mf.attname not in met_fields:
+                if mf.attname in get_fields:
+                    self.m2m.append(mf.name)
+                    get_fields.remove(mf.name)
+
+        # the remainder of fields
+        for maybe_field in get_fields:
+            if isinstance(maybe_field, tuple):
+                name, fields = maybe_field
+                self.rest.append((self.NESTED, name, fields))
+
+            elif maybe_field in met_fields:
+                self.rest.append((self.METHOD, maybe_field, met_fields[maybe_field]))
+
+            else:
+                attr = getattr(self.model, maybe_field, None)
+
+                if inspect.ismethod(attr):
+                    args = arg_names(attr)
+
+                    if 'request' in args:
+                        self.rest.append((self.CALL_REQUEST, maybe_field, None))
+                    elif len(args) <= 1:
+                        self.rest.append((self.CALL, maybe_field, None))
+                else:
+                    self.rest.append((self.ATTR, maybe_field, None))
+
+    def values_columns(self):
+        """
+        If everything this plan emits is a plain column,
+        returns the names of those columns as a tuple of
+        (regular fields, "remainder" fields), otherwise
+        `None`. Only then can we emit from `values_list()`
+        rows instead of model instances.
+        """
+        if not self.values_ok or self.plain:
+            return None
+
+        if self.fks or self.m2m or self.absolute_uri or self.api_url:
+            return None
+
+        concrete = set([ f.attname for f in self.model._meta.fields if not f.rel ])
+        rest = [ ]
+
+        for kind, name, extra in self.rest:
+            if kind != self.ATTR or name not in concrete:
+                return None
+            rest.append(name)
+
+        # Descriptors (file fields, `SubfieldBase`, deferred
+        # fields) transform the value, `values()` won't.
+        for name in self.attrs + rest:
+            if hasattr(self.model, name):
+                return None
+
+        return (self.attrs, rest)
+
+class ValuesRow(object):
+    """
+    Stand-in for a model instance on the `values()` fast
+    path, handed to `resource_uri`. It only carries the
+    fetched columns (and `pk`.)
+    """
+    def __init__(self, values):
+        self.__dict__ = values
+
 class Emitter(object):
     """
     Super emitter. All other emitters should subclass
@@ -62,6 +292,9 @@ class Emitter(object):
     as the methods on the handler. Issue58 says that's no good.
     """
     EMITTERS = { }
+    TYPE_ENCODERS = { }
+    TYPE_KINDS = { }
+    datetime_format = None
     RESERVED_FIELDS = set([ 'read', 'update', 'create',
                             'delete', 'model', 'anonymous',
                             'allowed_methods', 'fields', 'exclude' ])
@@ -90,225 +323,376 @@ class Emitter(object):
 
         return ret
 
-    def construct(self, request=None):
+    def construct(self, request=None, iterate=False):
         """
         Recursively serialize a lot of types, and
         in cases where it doesn't recognize the type,
         it will fall back to Django's `smart_unicode`.
 
-        Returns `dict`.
+        Returns `dict`. If `iterate` is set and the
+        payload is a collection (see `is_collection`),
+        returns an iterator over its serialized elements
+        instead, so they can be streamed out one by one.
         """
         def _any(thing, fields=None):
             """
             Dispatch, all types are routed through here.
+            See `Emitter.resolve_type`.
             """
-            ret = None
-
-            if isinstance(thing, QuerySet):
-                ret = _qs(thing, fields)
-            elif isinstance(thing, tuple) and hasattr(thing, '_asdict'):
-                ret = _dict(thing._asdict(), fields)
-            elif isinstance(thing, (tuple, list, set)):
-                ret = _list(thing, fields)
-            elif isinstance(thing, dict):
-                ret = _dict(thing, fields)
-            elif isinstance(thing, decimal.Decimal):
-                ret = str(thing)
-            elif isinstance(thing, Model):
-                ret = _model(thing, fields)
-            elif isinstance(thing, HttpResponse):
+            try:
+                kind, encoder = type_kinds[type(thing)]
+            except KeyError:
+                kind, encoder = self.resolve_type(type(thing))
+
+            if kind == PRIMITIVE:
+                return thing
+            elif kind == MODEL:
+                return _model(thing, fields)
+            elif kind == UNICODE:
+                return smart_unicode(thing, strings_only=True)
+            elif kind == DICT:
+                return _dict(thing, fields)
+            elif kind == LIST:
+                return _list(thing, fields)
+            elif kind == QUERYSET:
+                return _qs(thing, fields)
+            elif kind == DATETIME:
+                return encode_datetime(thing)
+            elif kind == DECIMAL:
+                return str(thing)
+            elif kind == NAMEDTUPLE:
+                return _dict(thing._asdict(), fields)
+            elif kind == CUSTOM:
+                ret = encoder(thing)
+
+                if ret is thing:
+                    return ret
+
+                return _any(ret, fields)
+            elif kind == RESPONSE:
                 raise HttpStatusCode(thing)
-            elif inspect.isfunction(thing):
-                if not inspect.getargspec(thing)[0]:
-                    ret = _any(thing())
-            elif hasattr(thing, '__emittable__'):
-                f = thing.__emittable__
-                if inspect.ismethod(f) and len(inspect.getargspec(f)[0]) == 1:
-                    ret = _any(f())
-            elif repr(thing).startswith("<django.db.models.fields.related.RelatedManager"):
-                ret = _any(thing.all())
-            elif isinstance(thing, datetime.datetime):
-                mtl = pytz.timezone(settings.TIME_ZONE)
-                thing = mtl.localize(thing)
-                thing = thing.astimezone(pytz.utc)
-                ret = thing.strftime("%Y-%m-%d %H:%M:%S %z")
-                #Original code
-                #ret = time.mktime(thing.timetuple()) * 1000
-            else:
-                ret = smart_unicode(thing, strings_only=True)
-
-            return ret
-
-        def _fk(data, field):
-            """
-            Foreign keys.
-            """
-            return _any(getattr(data, field.name))
+            elif kind == FUNCTION:
+                if not arg_names(thing):
+                    return _any(thing())
+            elif kind == EMITTABLE:
+                f = getattr(thing, '__emittable__', None)
+                if f is None:
+                    return smart_unicode(thing, strings_only=True)
+                if inspect.ismethod(f) and len(arg_names(f)) == 1:
+                    return _any(f())
+            elif kind == RELATED_MANAGER:
+                return _any(thing.all())
 
         def _related(data, fields=None):
             """
-            Foreign keys.
+            Foreign keys. Goes through `all()` so
+            prefetched relations are picked up.
             """
-            return [ _model(m, fields) for m in data.iterator() ]
+            return [ _model(m, fields) for m in data.all() ]
 
-        def _m2m(data, field, fields=None):
+        def _m2m(data, name, fields=None):
             """
             Many to many (re-route to `_model`.)
             """
-            return [ _model(m, fields) for m in getattr(data, field.name).iterator() ]
+            return _related(getattr(data, name), fields)
 
         def _model(data, fields=None):
             """
             Models. Will respect the `fields` and/or
             `exclude` on the handler (see `typemapper`.)
+            The field bookkeeping lives in a `FieldPlan`,
+            resolved once per class and `fields` spec.
             """
-            ret = { }
-
-            # Properly handle deferred models
-            # XXX This is fragile since we rely both
-            #     on _deferred and the fact that the
-            #     immediate parent class is that of
-            #     the original model
-            if getattr(data, '_deferred'):
-                klass = data.__class__.__bases__[0]
-            else:
-                klass = type(data)
+            plan = _plan(type(data), fields)
 
-            handler = self.in_typemapper(klass, self.anonymous)
-            get_absolute_uri = False
+            if plan.fragment_cache:
+                return _fragment(data, plan)
 
-            if handler or fields:
-                v = lambda f: getattr(data, f.attname)
+            return _fields(data, plan)
 
-                if not fields and handler:
-                    """
-                    Fields was not specified, try to find teh correct
-                    version in the typemapper we were sent.
-                    """
-                    get_fields = set(handler.fields)
-                    exclude_fields = set(handler.exclude).difference(get_fields)
+        def _plan(model, fields):
+            plan = plans.get((model, fields))
 
-                    if not get_fields:
-                        get_fields = set([ f.attname.replace("_id", "", 1)
-                            for f in data._meta.fields + data._meta.virtual_fields])
+            if plan is None:
+                plan = plans[model, fields] = self.get_plan(model, fields)
 
-                    if hasattr(handler, 'extra_fields'):
-                        get_fields.update(handler.extra_fields)
+            return plan
 
-                    # sets can be negated.
-                    for exclude in exclude_fields:
-                        if isinstance(exclude, basestring):
-                            get_fields.discard(exclude)
-
-                        elif isinstance(exclude, re._pattern_type):
-                            for field in get_fields.copy():
-                                if exclude.match(field):
-                                    get_fields.discard(field)
+        def _fields(data, plan):
+            """
+            What `_model` emits for `data`, following `plan`.
+            """
+            ret = { }
 
-                else:
-                    get_fields = set(fields)
+            if plan.plain:
+                for attname in plan.attrs:
+                    ret[attname] = _any(getattr(data, attname))
 
-                if 'absolute_uri' in get_fields:
-                    get_absolute_uri = True
+                for k in sorted(data.__dict__):
+                    if k not in plan.class_attrs:
+                        ret[k] = _any(getattr(data, k))
+            else:
+                for name in plan.attrs:
+                    ret[name] = _any(getattr(data, name))
 
-                met_fields = self.method_fields(handler, get_fields)
+                for name in plan.m2m:
+                    ret[name] = _m2m(data, name)
 
-                for f in data._meta.local_fields + data._meta.virtual_fields:
-                    if f.serialize and not any([ p in met_fields for p in [ f.attname, f.name ]]):
-                        if not f.rel:
-                            if f.attname in get_fields:
-                                ret[f.attname] = _any(v(f))
-                                get_fields.remove(f.attname)
-                        else:
-                            if f.attname[:-3] in get_fields:
-                                ret[f.name] = _fk(data, f)
-                                get_fields.remove(f.name)
-
-                for mf in data._meta.many_to_many:
-                    if mf.serialize and mf.attname not in met_fields:
-                        if mf.attname in get_fields:
-                            ret[mf.name] = _m2m(data, mf)
-                            get_fields.remove(mf.name)
-
-                # try to get the remainder of fields
-                for maybe_field in get_fields:
-                    if isinstance(maybe_field, (list, tuple)):
-                        model, fields = maybe_field
-                        inst = getattr(data, model, None)
+                for kind, name, extra in plan.rest:
+                    if kind == FieldPlan.NESTED:
+                        inst = getattr(data, name, None)
 
                         if inst:
                             if hasattr(inst, 'all'):
-                                ret[model] = _related(inst, fields)
+                                ret[name] = _related(inst, extra)
                             elif callable(inst):
-                                if len(inspect.getargspec(inst)[0]) == 1:
-                                    ret[model] = _any(inst(), fields)
+                                if len(arg_names(inst)) == 1:
+                                    ret[name] = _any(inst(), extra)
                             else:
-                                ret[model] = _model(inst, fields)
+                                ret[name] = _model(inst, extra)
 
-                    elif maybe_field in met_fields:
+                    elif kind == FieldPlan.METHOD:
                         # Overriding normal field which has a "resource method"
                         # so you can alter the contents of certain fields without
                         # using different names.
-                        ret[maybe_field] = _any(met_fields[maybe_field](data))
+                        ret[name] = _any(extra(data))
+
+                    elif kind == FieldPlan.CALL:
+                        ret[name] = _any(getattr(data, name)())
+
+                    elif kind == FieldPlan.CALL_REQUEST:
+                        ret[name] = _any(getattr(data, name)(request=request))
 
                     else:
-                        maybe = getattr(data, maybe_field, None)
+                        maybe = getattr(data, name, None)
                         if maybe is not None:
                             if callable(maybe):
-                                if 'request' in inspect.getargspec(maybe)[0]:
-                                    ret[maybe_field] = _any(maybe(request=request))
-                                elif len(inspect.getargspec(maybe)[0]) <= 1:
-                                    ret[maybe_field] = _any(maybe())
+                                if 'request' in arg_names(maybe):
+                                    ret[name] = _any(maybe(request=request))
+                                elif len(arg_names(maybe)) <= 1:
+                                    ret[name] = _any(maybe())
                             else:
-                                ret[maybe_field] = _any(maybe)
+                                ret[name] = _any(maybe)
                         else:
-                            handler_f = getattr(handler or self.handler, maybe_field, None)
+                            handler_f = getattr(plan.handler or self.handler, name, None)
 
                             if handler_f:
-                                ret[maybe_field] = _any(handler_f(data))
-
-            else:
-                for f in data._meta.fields:
-                    ret[f.attname] = _any(getattr(data, f.attname))
-
-                fields = dir(data.__class__) + ret.keys()
-                add_ons = [k for k in dir(data) if k not in fields]
-
-                for k in add_ons:
-                    ret[k] = _any(getattr(data, k))
+                                ret[name] = _any(handler_f(data))
 
             # resouce uri
-            if self.in_typemapper(type(data), self.anonymous):
-                handler = self.in_typemapper(type(data), self.anonymous)
-                if hasattr(handler, 'resource_uri'):
-                    url_id, fields = handler.resource_uri(data)
+            if plan.uri_handler:
+                url_id, fields = plan.uri_handler.resource_uri(data)
 
-                    try:
-                        ret['resource_uri'] = reverser( lambda: (url_id, fields) )()
-                    except NoReverseMatch, e:
-                        pass
+                try:
+                    ret['resource_uri'] = build_uri(url_id, fields)
+                except NoReverseMatch:
+                    pass
 
-            if hasattr(data, 'get_api_url') and 'resource_uri' not in ret:
+            if plan.api_url and 'resource_uri' not in ret:
                 try: ret['resource_uri'] = data.get_api_url()
                 except: pass
 
             # absolute uri
-            if hasattr(data, 'get_absolute_url') and get_absolute_uri:
+            if plan.absolute_uri:
                 try: ret['absolute_uri'] = data.get_absolute_url()
                 except: pass
 
             return ret
 
+        def _fragment(data, plan):
+            """
+            Models whose handler has `fragment_cache` set. The
+            dict comes from the cache when it's there, and goes
+            in otherwise. Entries fetched ahead for a batch (see
+            `_fetch_fragments`) are written back together.
+            """
+            key = caching.fragment_key(type(data), data.pk)
+            fid = fragment_ids.get(plan)
+
+            if fid is None:
+                fid = fragment_ids[plan] = caching.fragment_id(plan.handler,
+                    plan.fields, bool(self.anonymous), type(self))
+
+            if key in fragments:
+                entry = fragments[key]
+            else:
+                entry = cache.get(key) or { }
+
+            if fid in entry:
+                return entry[fid]
+
+            ret = entry[fid] = _fields(data, plan)
+
+            if key in fragments:
+                pending[key] = plan.fragment_timeout
+            else:
+                cache.set(key, entry, plan.fragment_timeout)
+
+            return ret
+
+        def _fetch_fragments(objs):
+            """
+            Gets the cached fragments of model instances `objs`
+            in one go. Returns the keys, for `_store_fragments`.
+            """
+            keys = [ caching.fragment_key(type(v), v.pk) for v in objs ]
+            found = cache.get_many(keys)
+
+            for key in keys:
+                fragments[key] = found.get(key) or { }
+
+            return keys
+
+        def _store_fragments(keys):
+            """
+            Writes back the entries of `keys` that got new
+            fragments, with a `set_many` per timeout.
+            """
+            writes = { }
+
+            for key in keys:
+                entry = fragments.pop(key, None)
+
+                if key in pending:
+                    writes.setdefault(pending.pop(key), { })[key] = entry
+
+            for timeout, entries in writes.iteritems():
+                cache.set_many(entries, timeout)
+
+        def _iter_values(data, fields, plan, attrs, rest):
+            """
+            Querysets whose plan only needs columns, emitted
+            straight from `values_list()` rows. If `resource_uri`
+            turns out to need a real instance, we go back to
+            instances (for the rows left, or all of them if it's
+            the first one.)
+            """
+            names = attrs + rest
+            uri_handler = plan.uri_handler
+            pk = plan.model._meta.pk.attname
+
+            if pk not in names:
+                names = names + [ pk ]
+
+            n = len(attrs)
+            first = True
+            rows = iter(self.iterate_queryset(data.values_list(*names),
+                                              operator.itemgetter(names.index(pk))))
+
+            for row in rows:
+                d = { }
+
+                for name, value in zip(attrs, row):
+                    d[name] = _any(value)
+
+                for name, value in zip(rest, row[n:]):
+                    if value is not None:
+                        d[name] = _any(value)
+
+                if uri_handler:
+                    values = dict(zip(names, row))
+                    values['pk'] = values[pk]
+
+                    try:
+                        url_id, args = uri_handler.resource_uri(ValuesRow(values))
+                    except AttributeError:
+                        plan.values_ok = False
+
+                        if first:
+                            for v in _iter_instances(data, fields):
+                                yield v
+                            return
+
+                        left = itertools.chain([ values[pk] ],
+                            itertools.imap(operator.itemgetter(names.index(pk)), rows))
+
+                        for v in _iter_pks(plan.model, left, fields):
+                            yield v
+                        return
+
+                    try:
+                        d['resource_uri'] = build_uri(url_id, args)
+                    except NoReverseMatch:
+                        pass
+
+                first = False
+                yield d
+
+        def _iter_pks(model, pks, fields=None):
+            """
+            Instances of `model` by primary keys `pks`, in that
+            order, fetched a few hundred at a time (SQLite
+            takes up to 999 parameters.)
+            """
+            pks = iter(pks)
+
+            while True:
+                batch = list(itertools.islice(pks, 500))
+
+                if not batch:
+                    break
+
+                qs = self.prepare_queryset(model._base_manager.filter(pk__in=batch), fields)
+                objs = dict([ (obj.pk, obj) for obj in qs ])
+
+                for key in batch:
+                    if key in objs:
+                        yield _any(objs[key], fields)
+
+        def _iter_instances(data, fields=None):
+            rows = iter(self.iterate_queryset(self.prepare_queryset(data, fields)))
+
+            if not self.get_plan(data.model, fields).fragment_cache:
+                for v in rows:
+                    yield _any(v, fields)
+                return
+
+            batch_size = getattr(settings, 'PISTON_FRAGMENT_BATCH_SIZE', 100)
+
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+
+                if not batch:
+                    break
+
+                keys = _fetch_fragments(batch)
+
+                for v in batch:
+                    yield _any(v, fields)
+
+                _store_fragments(keys)
+
+        def _iter_qs(data, fields=None):
+            """
+            Querysets, one constructed element at a time.
+            """
+            columns = self.values_columns(data, fields)
+
+            if columns:
+                return _iter_values(data, fields, self.get_plan(data.model, fields), *columns)
+
+            return _iter_instances(data, fields)
+
         def _qs(data, fields=None):
             """
             Querysets.
             """
-            return [ _any(v, fields) for v in data ]
+            return list(_iter_qs(data, fields))
 
         def _list(data, fields=None):
             """
             Lists.
             """
+            if isinstance(data, (list, tuple)):
+                cached = [ v for v in data if isinstance(v, Model)
+                           and _plan(type(v), fields).fragment_cache ]
+
+                if cached:
+                    keys = _fetch_fragments(cached)
+                    ret = [ _any(v, fields) for v in data ]
+                    _store_fragments(keys)
+                    return ret
+
             return [ _any(v, fields) for v in data ]
 
         def _dict(data, fields=None):
@@ -317,10 +701,501 @@ class Emitter(object):
             """
             return dict([ (k, _any(v, fields)) for k, v in data.iteritems() ])
 
+        # Plans resolved during this run, by (class, fields).
+        plans = { }
+        # Fragment cache bookkeeping, see `_fragment`.
+        fragment_ids, fragments, pending = { }, { }, { }
+        type_kinds = Emitter.TYPE_KINDS.setdefault(type(self), { })
+        encode_datetime = self.datetime_encoder()
+        fields = freeze_fields(self.fields)
+
+        if iterate and self.is_collection():
+            if isinstance(self.data, QuerySet):
+                return _iter_qs(self.data, fields)
+            return ( _any(v, fields) for v in self.data )
+
         # Kickstart the seralizin'.
-        return _any(self.data, self.fields)
+        return _any(self.data, fields)
+
+    @classmethod
+    def register_type(cls, klass, encoder):
+        """
+        Register an encoder for instances of `klass` (and
+        its subclasses) in this emitter and its subclasses.
+
+        `encoder` gets the object and returns something to
+        emit in its place, which is dispatched again, so it
+        shouldn't hand back another `klass`. Returning the
+        object itself emits it untouched, for emitters that
+        can deal with the type natively.
+        """
+        if 'TYPE_ENCODERS' not in cls.__dict__:
+            cls.TYPE_ENCODERS = { }
+
+        cls.TYPE_ENCODERS[klass] = encoder
+        Emitter.TYPE_KINDS.clear()
+
+    @classmethod
+    def unregister_type(cls, klass):
+        encoder = cls.__dict__.get('TYPE_ENCODERS', { }).pop(klass, None)
+        Emitter.TYPE_KINDS.clear()
+        return encoder
+
+    def resolve_type(self, t):
+        """
+        Works out how `construct` deals with instances of
+        type `t`, returning a tuple of (kind, encoder). The
+        result is cached per emitter class and type, so
+        the checks below run once per type, not per value.
+        """
+        encoders = [ c.TYPE_ENCODERS for c in type(self).__mro__
+                     if 'TYPE_ENCODERS' in c.__dict__ ]
+
+        for base in t.__mro__:
+            for registry in encoders:
+                if base in registry:
+                    return self._cache_kind(t, CUSTOM, registry[base])
+
+        if issubclass(t, QuerySet):
+            kind = QUERYSET
+        elif issubclass(t, tuple) and hasattr(t, '_asdict'):
+            kind = NAMEDTUPLE
+        elif issubclass(t, (tuple, list, set, types.GeneratorType)):
+            kind = LIST
+        elif issubclass(t, dict):
+            kind = DICT
+        elif issubclass(t, decimal.Decimal):
+            kind = DECIMAL
+        elif issubclass(t, Model):
+            kind = MODEL
+        elif issubclass(t, HttpResponse):
+            kind = RESPONSE
+        elif issubclass(t, types.FunctionType):
+            kind = FUNCTION
+        elif hasattr(t, '__emittable__') or t is types.InstanceType:
+            # (old-style instances all share one type)
+            kind = EMITTABLE
+        elif t.__name__ == 'RelatedManager' and \
+                t.__module__ == 'django.db.models.fields.related':
+            # Related manager classes are made on the fly for every
+            # relation access, so these don't go in the cache.
+            return (RELATED_MANAGER, None)
+        elif issubclass(t, datetime.datetime):
+            kind = DATETIME
+        elif issubclass(t, PRIMITIVE_TYPES):
+            kind = PRIMITIVE
+        else:
+            kind = UNICODE
+
+        return self._cache_kind(t, kind, None)
+
+    def _cache_kind(self, t, kind, encoder):
+        Emitter.TYPE_KINDS.setdefault(type(self), { })[t] = (kind, encoder)
+        return (kind, encoder)
+
+    def datetime_encoder(self):
+        """
+        Returns the function used to serialize datetimes.
+        The format (see `piston.datetimes.FORMATS`) can be
+        set with `datetime_format` on the handler or the
+        emitter class, or with `PISTON_DATETIME_FORMAT`.
+        """
+        format = getattr(self.handler, 'datetime_format', None) or self.datetime_format
+        return datetime_encoder(format)
+
+    def is_collection(self):
+        """
+        Whether the payload is a sequence of resources
+        (a QuerySet, list, tuple, set or a generator.)
+        """
+        if isinstance(self.data, tuple) and hasattr(self.data, '_asdict'):
+            return False
+
+        return isinstance(self.data, (QuerySet, list, tuple, set, types.GeneratorType))
+
+    def plan_columns(self):
+        """
+        The keys `construct` will emit for the model in the
+        payload, in the order of the handler's `fields`, or
+        `None` if the payload isn't a model or QuerySet.
+        """
+        if isinstance(self.data, QuerySet):
+            model = self.data.model
+        elif isinstance(self.data, Model):
+            model = type(self.data)
+        else:
+            return None
+
+        plan = self.get_plan(model, freeze_fields(self.fields))
+
+        if plan.plain:
+            return None
+
+        names = plan.attrs + [ name for kind, name, extra in plan.rest ] + plan.m2m
+
+        if plan.uri_handler or plan.api_url:
+            names.append('resource_uri')
+        if plan.absolute_uri:
+            names.append('absolute_uri')
+
+        columns = [ ]
+
+        for field in freeze_fields(plan.fields or getattr(plan.handler, 'fields', ())):
+            if isinstance(field, tuple):
+                field = field[0]
+            if field in names and field not in columns:
+                columns.append(field)
+
+        return columns + [ name for name in names if name not in columns ]
+
+    def get_plan(self, model, fields=None):
+        """
+        Returns the `FieldPlan` for instances of `model`,
+        as seen through the handler registered for it in
+        the `typemapper` (or through `fields`, if given.)
+        """
+        # Properly handle deferred models
+        # XXX This is fragile since we rely both
+        #     on _deferred and the fact that the
+        #     immediate parent class is that of
+        #     the original model
+        if getattr(model, '_deferred', False):
+            klass = model.__bases__[0]
+        else:
+            klass = model
+
+        handler = self.in_typemapper(klass, self.anonymous)
+        uri_handler = self.in_typemapper(model, self.anonymous)
+
+        if not hasattr(uri_handler, 'resource_uri'):
+            uri_handler = None
+
+        fields = fields or None
+        method_fields = type(self).method_fields.im_func
+        key = (model, handler, uri_handler, fields, method_fields)
+        plan = FieldPlan.PLANS.get(key)
+
+        if plan is None:
+            plan = FieldPlan(self, model, klass, handler, uri_handler, fields)
+
+            if len(FieldPlan.PLANS) >= getattr(settings, 'PISTON_PLAN_CACHE_SIZE', 1000):
+                FieldPlan.PLANS.clear()
+
+            FieldPlan.PLANS[key] = plan
+
+        return plan
+
+    def related_lookups(self, model, fields=None):
+        """
+        Works out which relations emitting `model` instances
+        through `fields` (and the handlers of the related
+        models) is going to follow, so they can be fetched
+        up front instead of with a query per instance.
+
+        Returns a tuple of (`select_related` lookups,
+        `prefetch_related` lookups.)
+        """
+        plan = self.get_plan(model, fields)
+        anonymous = bool(self.anonymous)
+
+        if anonymous not in plan.lookups:
+            select, prefetch = [ ], [ ]
+            self._walk_related(model, fields, '', False, select, prefetch, set())
+            plan.lookups[anonymous] = (select, prefetch)
+
+        return plan.lookups[anonymous]
+
+    def _walk_related(self, model, fields, prefix, prefetching, select, prefetch, seen):
+        if (model, fields) in seen:
+            return
+
+        plan = self.get_plan(model, fields)
+
+        if plan.plain:
+            return
+
+        seen = seen | set([ (model, fields) ])
+
+        def follow(name, target, fields, many):
+            lookup = prefix + name
+
+            if many or prefetching:
+                prefetch.append(lookup)
+            else:
+                select.append(lookup)
+
+            self._walk_related(target, fields, lookup + '__',
+                               many or prefetching, select, prefetch, seen)
+
+        for f in plan.fks:
+            follow(f.name, f.rel.to, None, False)
+
+        for name in plan.m2m:
+            follow(name, getattr(model, name).field.rel.to, None, True)
+
+        for kind, name, fields in plan.rest:
+            if kind != FieldPlan.NESTED:
+                continue
+
+            desc = getattr(model, name, None)
+
+            if isinstance(desc, ReverseSingleRelatedObjectDescriptor):
+                follow(name, desc.field.rel.to, fields, False)
+            elif isinstance(desc, SingleRelatedObjectDescriptor):
+                follow(name, desc.related.model, fields, False)
+            elif isinstance(desc, ReverseManyRelatedObjectsDescriptor):
+                follow(name, desc.field.rel.to, fields, True)
+            elif isinstance(desc, (ForeignRelatedObjectsDescriptor,
+                                   ManyRelatedObjectsDescriptor)):
+                follow(name, desc.related.model, fields, True)
+
+    def required_columns(self, model, fields=None):
+        """
+        The columns emitting `model` instances through `fields`
+        reads, as arguments for `only()`, including those of the
+        forward relations we `select_related`. `None` if there's
+        no telling: model methods, handler methods, properties
+        and `resource_uri` may read any column.
+        """
+        plan = self.get_plan(model, fields)
+        anonymous = bool(self.anonymous)
+
+        if anonymous not in plan.columns:
+            fallbacks = [ ]
+            columns = self._walk_columns(model, fields, '', set(), fallbacks)
+            plan.columns[anonymous] = columns, fallbacks
+
+        columns, fallbacks = plan.columns[anonymous]
+
+        # Plans are shared between handlers, so whether ours
+        # has those methods is up to the handler at hand.
+        for name in fallbacks:
+            if getattr(self.handler, name, None) is not None:
+                return None
+
+        return columns
+
+    def _walk_columns(self, model, fields, prefix, seen, fallbacks):
+        plan = self.get_plan(model, fields)
+
+        if plan.plain or (model, fields) in seen:
+            return None
+
+        if plan.uri_handler or plan.api_url or plan.absolute_uri:
+            return None
+
+        seen = seen | set([ (model, fields) ])
+        meta = model._meta
+        concrete = dict([ (f.attname, f.name) for f in meta.fields ])
+        columns = [ prefix + meta.pk.name ]
+
+        def follow(name, target, fields):
+            columns.append(prefix + name)
+            columns.extend(self._walk_columns(target, fields, prefix + name + '__',
+                                              seen, fallbacks) or ())
+
+        # (foreign keys are in `attrs` by name, see `fks`)
+        for name in plan.attrs:
+            if name in concrete:
+                columns.append(prefix + concrete[name])
+
+        for f in plan.fks:
+            follow(f.name, f.rel.to, None)
+
+        for kind, name, fields in plan.rest:
+            if kind == FieldPlan.ATTR and name in concrete:
+                # A `None` there makes `construct` call the
+                # handler method of that name, see `values_columns`.
+                if plan.handler is None:
+                    fallbacks.append(name)
+                elif getattr(plan.handler, name, None) is not None:
+                    return None
+
+                columns.append(prefix + concrete[name])
+                continue
+            elif kind != FieldPlan.NESTED:
+                return None
+
+            desc = getattr(model, name, None)
+
+            if isinstance(desc, ReverseSingleRelatedObjectDescriptor):
+                follow(name, desc.field.rel.to, fields)
+            elif not isinstance(desc, (ForeignRelatedObjectsDescriptor, ManyRelatedObjectsDescriptor,
+                                       ReverseManyRelatedObjectsDescriptor)):
+                # Reverse one-to-ones, methods returning models etc.
+                return None
+
+        return columns
+
+    def values_columns(self, data, fields=None):
+        """
+        Decides whether QuerySet `data` can be emitted from
+        `values_list()` rows rather than model instances, see
+        `FieldPlan.values_columns`. Can be turned off with
+        `PISTON_VALUES_FAST_PATH = False`.
+        """
+        if not getattr(settings, 'PISTON_VALUES_FAST_PATH', True):
+            return None
+
+        if data._result_cache is not None or isinstance(data, ValuesQuerySet):
+            return None
+
+        # only()/defer() hand out deferred classes
+        if data.query.deferred_loading[0]:
+            return None
+
+        plan = self.get_plan(data.model, fields)
+        columns = plan.values_columns()
+
+        if columns is None:
+            return None
+
+        # A `None` in one of the remainder fields makes
+        # `construct` look for a handler method instead.
+        handler = plan.handler or self.handler
+
+        for name in columns[1]:
+            if getattr(handler, name, None) is not None:
+                return None
+
+        return columns
+
+    def prepare_queryset(self, data, fields=None):
+        """
+        Applies `select_related`/`prefetch_related` for the
+        relations we're about to emit (see `related_lookups`)
+        to a QuerySet that hasn't been evaluated yet, and
+        leaves out the columns we won't emit (see
+        `prune_queryset`) if the handler opts in with
+        `auto_only = True`. Handlers can opt out of the former
+        by setting `auto_related = False`.
+        """
+        if data._result_cache is not None or isinstance(data, ValuesQuerySet):
+            return data
+
+        related = getattr(self.handler, 'auto_related', True)
+
+        if related:
+            select, prefetch = self.related_lookups(data.model, fields)
+
+            if select and data.query.select_related is not True:
+                data = data.select_related(*select)
+
+            # `prefetch_related` is only there on Django 1.4+
+            if prefetch and hasattr(data, 'prefetch_related'):
+                data = data.prefetch_related(*prefetch)
+
+        if getattr(self.handler, 'auto_only', False):
+            data = self.prune_queryset(data, fields, related)
+
+        return data
+
+    def prune_queryset(self, data, fields=None, related=True):
+        """
+        Restricts QuerySet `data` with `only()` to the columns
+        we're going to emit (see `required_columns`), so large
+        columns nobody asked for aren't fetched. Columns of
+        related models are only restricted when they're fetched
+        with `select_related` (`related`.) QuerySets with
+        their own `only()`/`defer()` are left alone, and it
+        can be turned off with `PISTON_PRUNE_COLUMNS = False`.
+        """
+        if not getattr(settings, 'PISTON_PRUNE_COLUMNS', True):
+            return data
+
+        names, defer = data.query.deferred_loading
+
+        if names or not defer:
+            return data
+
+        columns = self.required_columns(data.model, fields)
+
+        if columns is None:
+            return data
+
+        if not related:
+            columns = [ name for name in columns if '__' not in name ]
+
+        local = set([ f.name for f in data.model._meta.fields ])
+
+        # Nothing to leave out.
+        if local <= set(columns) and not [ name for name in columns if '__' in name ]:
+            return data
+
+        return data.only(*columns)
+
+    def iterate_queryset(self, data, key=operator.attrgetter('pk')):
+        """
+        Iterates over QuerySet `data` in chunks, so instances
+        can go as soon as they've been serialized instead of
+        piling up in the QuerySet's result cache.
+
+        Kicks in for QuerySets that may hold more than
+        `PISTON_QUERYSET_CHUNK_THRESHOLD` rows (default `None`,
+        off.) We can't know that without counting, so only
+        sliced QuerySets can stay below it. Chunks are fetched
+        `PISTON_QUERYSET_CHUNK_SIZE` (default 1000) at a time
+        by primary key ranges when the QuerySet is ordered by
+        (or not ordered beyond) its primary key, and with
+        `iterator()` otherwise. `key` gets the primary key
+        out of whatever the QuerySet yields.
+        """
+        threshold = getattr(settings, 'PISTON_QUERYSET_CHUNK_THRESHOLD', None)
+
+        if threshold is None or data._result_cache is not None:
+            return data
+
+        query = data.query
+
+        if query.high_mark is not None and query.high_mark - query.low_mark <= threshold:
+            return data
+
+        size = getattr(settings, 'PISTON_QUERYSET_CHUNK_SIZE', 1000)
+        meta = data.model._meta
+
+        if query.low_mark == 0 and query.high_mark is None and not query.extra_order_by:
+            ordering = tuple(query.order_by or
+                             (query.default_ordering and meta.ordering) or ())
+
+            if ordering in ((), ('pk',), (meta.pk.name,), (meta.pk.attname,)):
+                return self._keyset_chunks(data, size, 'pk', 'pk__gt', key)
+            elif ordering in (('-pk',), ('-' + meta.pk.name,), ('-' + meta.pk.attname,)):
+                return self._keyset_chunks(data, size, '-pk', 'pk__lt', key)
+
+        # `iterator()` skips `prefetch_related`, don't trade
+        # a bit of memory for a query per instance.
+        if getattr(data, '_prefetch_related_lookups', None):
+            return data
+
+        return data.iterator()
+
+    def _keyset_chunks(self, data, size, order_by, lookup, key):
+        data = data.order_by(order_by)
+        last = None
+
+        while True:
+            qs = data
+
+            if last is not None:
+                qs = qs.filter(**{ lookup: last })
+
+            chunk = list(qs[:size])
+
+            for obj in chunk:
+                yield obj
+
+            if len(chunk) < size:
+                break
+
+            last = key(chunk[-1])
+            del chunk
 
     def in_typemapper(self, model, anonymous):
+        lookup = getattr(self.typemapper, 'for_model', None)
+
+        if lookup is not None:
+            return lookup(model, anonymous)
+
         for klass, (km, is_anon, default) in self.typemapper.iteritems():
             if model is km and is_anon is anonymous:
                 return klass
@@ -400,25 +1275,170 @@ class XMLEmitter(Emitter):
 
         return stream.getvalue()
 
+    def stream_render(self, request, stream=True):
+        """
+        Streams collections: every `<resource>` is written
+        as soon as its element has been constructed, and the
+        buffer is flushed out whenever it grows past
+        `PISTON_STREAM_CHUNK_SIZE` bytes (default 8192.)
+        """
+        if not self.is_collection():
+            yield self.render(request)
+            return
+
+        chunk_size = getattr(settings, 'PISTON_STREAM_CHUNK_SIZE', 8192)
+        stream = StringIO.StringIO()
+
+        xml = SimplerXMLGenerator(stream, "utf-8")
+        xml.startDocument()
+        xml.startElement("response", {})
+
+        for item in self.construct(iterate=True):
+            xml.startElement("resource", {})
+            self._to_xml(xml, item)
+            xml.endElement("resource")
+
+            if stream.tell() >= chunk_size:
+                yield stream.getvalue()
+                stream.seek(0)
+                stream.truncate()
+
+        xml.endElement("response")
+        xml.endDocument()
+
+        yield stream.getvalue()
+
 Emitter.register('xml', XMLEmitter, 'text/xml; charset=utf-8')
 Mimer.register(lambda *a: None, ('text/xml',))
 
 class JSONEmitter(Emitter):
     """
     JSON emitter, understands timestamps.
+
+    Output is compact unless asked for with `?pretty=1`
+    (or `PISTON_JSON_PRETTY`), and encoded by the backend
+    set in `PISTON_JSON_BACKEND` (see `json_backends`.)
     """
-    def render(self, request=None):
+    def dumps(self, data, pretty=False):
+        return json_backends.get_backend().dumps(data, pretty)
+
+    def callback(self, request):
         cb = request and request.GET.get('callback', None)
-        seria = simplejson.dumps(self.construct(request=request), cls=DateTimeAwareJSONEncoder, ensure_ascii=False, indent=4)
 
-        # Callback
         if cb and is_valid_jsonp_callback_value(cb):
+            return cb
+
+    def pretty(self, request):
+        if request and 'pretty' in request.GET:
+            return request.GET['pretty'] not in ('0', 'false', 'no')
+
+        return getattr(settings, 'PISTON_JSON_PRETTY', False)
+
+    def render(self, request=None):
+        cb = self.callback(request)
+        seria = self.dumps(self.construct(request=request), self.pretty(request))
+
+        # Callback
+        if cb:
             return '%s(%s)' % (cb, seria)
 
         return seria
 
+    def stream_render(self, request, stream=True):
+        """
+        Streams collections: every element is encoded
+        and sent off as soon as it's been constructed,
+        so the document never has to be held in memory.
+        Output is buffered up to `PISTON_STREAM_CHUNK_SIZE`
+        bytes (default 8192) between yields.
+        """
+        if not self.is_collection():
+            yield self.render(request)
+            return
+
+        cb = self.callback(request)
+        pretty = self.pretty(request)
+        prefix, suffix = '[', ']'
+
+        if cb:
+            prefix, suffix = '%s([' % cb, '])'
+
+        chunk_size = getattr(settings, 'PISTON_STREAM_CHUNK_SIZE', 8192)
+        buf, size, sep = [ prefix ], len(prefix), ''
+
+        for item in self.construct(request=request, iterate=True):
+            seria = sep + self.dumps(item, pretty)
+            sep = pretty and ', ' or ','
+
+            buf.append(seria)
+            size += len(seria)
+
+            if size >= chunk_size:
+                yield ''.join(buf)
+                buf, size = [ ], 0
+
+        buf.append(suffix)
+        yield ''.join(buf)
+
 Emitter.register('json', JSONEmitter, 'application/json; charset=utf-8')
-Mimer.register(simplejson.loads, ('application/json',))
+Mimer.register(json_backends.loads, ('application/json',))
+
+class NDJSONEmitter(Emitter):
+    """
+    Newline delimited JSON: one compact JSON document per
+    line, a line per resource for collections.
+    """
+    def render(self, request=None):
+        return ''.join(self.stream_render(request))
+
+    def stream_render(self, request, stream=True):
+        """
+        Writes every resource out as soon as it's been
+        constructed, buffering up to `PISTON_STREAM_CHUNK_SIZE`
+        bytes.
+        """
+        dumps = json_backends.get_backend().dumps
+
+        if not self.is_collection():
+            yield dumps(self.construct(request=request)) + '\n'
+            return
+
+        chunk_size = getattr(settings, 'PISTON_STREAM_CHUNK_SIZE', 8192)
+        buf, size = [ ], 0
+
+        for item in self.construct(request=request, iterate=True):
+            seria = dumps(item) + '\n'
+            buf.append(seria)
+            size += len(seria)
+
+            if size >= chunk_size:
+                yield ''.join(buf)
+                buf, size = [ ], 0
+
+        yield ''.join(buf)
+
+def ndjson_records(stream):
+    """
+    Loader for newline delimited JSON. Records are parsed
+    one line at a time as they're iterated over, so a
+    handler can go through any number of them in bounded
+    memory.
+    """
+    loads = json_backends.get_backend().loads
+
+    for n, line in enumerate(iter(stream.readline, '')):
+        line = line.strip()
+
+        if not line:
+            continue
+
+        try:
+            yield loads(line)
+        except ValueError:
+            raise MimerDataException("Invalid JSON on line %d" % (n + 1))
+
+Emitter.register('ndjson', NDJSONEmitter, 'application/x-ndjson; charset=utf-8')
+Mimer.register(ndjson_records, ('application/x-ndjson',), streaming=True)
 
 class YAMLEmitter(Emitter):
     """
@@ -452,6 +1472,361 @@ Uncomment the line below to enable it. You're doing so at your own risk.
 """
 # Mimer.register(pickle.loads, ('application/python-pickle',))
 
+class CBOREmitter(Emitter):
+    """
+    CBOR emitter (see `piston.cbor`.) Datetimes, decimals
+    and byte strings are left to the encoder, which has
+    native representations for them. `str` goes out as a
+    text string when it's UTF-8, and as bytes otherwise.
+    """
+    def render(self, request=None):
+        return cbor.dumps(self.construct(request=request))
+
+    def stream_render(self, request, stream=True):
+        """
+        Streams collections as an indefinite-length array,
+        buffering up to `PISTON_STREAM_CHUNK_SIZE` bytes.
+        """
+        if not self.is_collection():
+            yield self.render(request)
+            return
+
+        chunk_size = getattr(settings, 'PISTON_STREAM_CHUNK_SIZE', 8192)
+        buf, size = [ cbor.INDEFINITE_ARRAY ], 1
+
+        for item in self.construct(request=request, iterate=True):
+            start = len(buf)
+            cbor.encode(item, buf)
+            size += sum([ len(part) for part in buf[start:] ])
+
+            if size >= chunk_size:
+                yield ''.join(buf)
+                buf, size = [ ], 0
+
+        buf.append(cbor.BREAK)
+        yield ''.join(buf)
+
+for klass in (datetime.datetime, decimal.Decimal, str, bytearray, buffer):
+    CBOREmitter.register_type(klass, lambda value: value)
+
+Emitter.register('cbor', CBOREmitter, 'application/cbor')
+Mimer.register(cbor.loads, ('application/cbor',))
+
+class CSVEmitter(Emitter):
+    """
+    CSV emitter, for flat, tabular data. Every resource
+    is a row, and rows are written out as they're
+    constructed when streaming.
+
+    Columns come from the field plan of the model being
+    emitted, in the order the handler's `fields` has them
+    (otherwise from the keys of the first row.) Nested
+    values are dealt with by `csv_flatten` on the handler,
+    or `PISTON_CSV_FLATTEN`:
+
+     - 'json' (the default): as compact JSON.
+     - 'dotted': dicts are spread out over columns named
+       "parent.child", other nested values are JSON.
+     - a function taking the nested value and returning
+       the string to put in its cell.
+    """
+    delimiter = ','
+
+    def flatten_rule(self):
+        return getattr(self.handler, 'csv_flatten', None) or \
+            getattr(settings, 'PISTON_CSV_FLATTEN', 'json')
+
+    def flatten(self, row, rule, prefix=''):
+        """
+        Spreads out nested dicts in `row` with the 'dotted' rule.
+        """
+        flat = { }
+
+        for key, value in row.iteritems():
+            if isinstance(value, dict) and rule == 'dotted':
+                flat.update(self.flatten(value, rule, '%s%s.' % (prefix, key)))
+            else:
+                flat[prefix + key] = value
+
+        return flat
+
+    def columns(self, first, planned):
+        if planned is None:
+            return sorted(first)
+
+        columns = [ ]
+
+        for name in planned:
+            if name in first:
+                columns.append(name)
+            else:
+                nested = [ key for key in first if key.startswith(name + '.') ]
+                columns.extend(sorted(nested) or [ name ])
+
+        return columns
+
+    def cell(self, value, rule):
+        if value is None:
+            return ''
+        elif isinstance(value, bool):
+            return value and 'true' or 'false'
+        elif isinstance(value, unicode):
+            return value.encode('utf-8')
+        elif isinstance(value, float):
+            return repr(value)
+        elif isinstance(value, (dict, list, tuple)):
+            if callable(rule):
+                return smart_str(rule(value))
+            return smart_str(json_backends.get_backend().dumps(value))
+
+        return smart_str(value)
+
+    def render(self, request=None):
+        return ''.join(self.stream_render(request))
+
+    def stream_render(self, request, stream=True):
+        """
+        Writes a header row and then a row per resource,
+        buffering up to `PISTON_STREAM_CHUNK_SIZE` bytes.
+        """
+        if self.is_collection():
+            rows = self.construct(request=request, iterate=True)
+        else:
+            rows = [ self.construct(request=request) ]
+
+        rule = self.flatten_rule()
+        planned = self.plan_columns()
+        chunk_size = getattr(settings, 'PISTON_STREAM_CHUNK_SIZE', 8192)
+
+        buf = StringIO.StringIO()
+        writer = csv.writer(buf, delimiter=self.delimiter, lineterminator='\r\n')
+        columns = None
+
+        for row in rows:
+            if not isinstance(row, dict):
+                row = { 'value': row }
+
+            row = self.flatten(row, rule)
+
+            if columns is None:
+                columns = self.columns(row, planned)
+                writer.writerow(columns)
+
+            writer.writerow([ self.cell(row.get(column), rule) for column in columns ])
+
+            if buf.tell() >= chunk_size:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+
+        if columns is None and planned:
+            writer.writerow(planned)
+
+        yield buf.getvalue()
+
+class TSVEmitter(CSVEmitter):
+    """
+    Tab-separated variant of `CSVEmitter`.
+    """
+    delimiter = '\t'
+
+Emitter.register('csv', CSVEmitter, 'text/csv; charset=utf-8')
+Emitter.register('tsv', TSVEmitter, 'text/tab-separated-values; charset=utf-8')
+
+# Column values `construct` would hand back untouched.
+NATIVE_COLUMN_TYPES = set([ int, long, float, bool, unicode, type(None) ])
+
+class ColumnarEmitter(JSONEmitter):
+    """
+    Column-oriented JSON, for wide collections of numbers
+    (time series, metrics) where repeating every key on
+    every row is most of the payload:
+
+        {"columns": ["at", "value"],
+         "data": {"at": [...], "value": [...]}}
+
+    Columns are ordered like `CSVEmitter` orders them, and
+    rows missing a key get `null` in its column.
+
+    QuerySets whose plan only needs plain columns (see
+    `FieldPlan.values_columns`) and that don't have a
+    `resource_uri` are read straight from `values_list()`
+    into the columns. Everything else goes through
+    `construct`, like with the other emitters.
+    """
+    def table(self, request=None):
+        """
+        Returns the payload as (columns, { column: values }).
+        """
+        fields = freeze_fields(self.fields)
+        data = None
+
+        if isinstance(self.data, QuerySet):
+            names = self.values_columns(self.data, fields)
+
+            if names and self.get_plan(self.data.model, fields).uri_handler is None:
+                data = self.values_table(names[0] + names[1])
+
+        if data is None:
+            data = self.rows_table(request)
+
+        planned = [ name for name in self.plan_columns() or () if name in data ]
+        columns = planned + sorted([ key for key in data if key not in planned ])
+
+        return columns, data
+
+    def rows_table(self, request):
+        if self.is_collection():
+            rows = self.construct(request=request, iterate=True)
+        else:
+            rows = [ self.construct(request=request) ]
+
+        data, n = { }, 0
+
+        for row in rows:
+            if not isinstance(row, dict):
+                row = { 'value': row }
+
+            for key in row:
+                if key not in data:
+                    data[key] = [ None ] * n
+
+            for key, values in data.iteritems():
+                values.append(row.get(key))
+
+            n += 1
+
+        return data
+
+    def values_table(self, names):
+        pk = self.data.model._meta.pk.attname
+        fetched = names
+
+        if pk not in names:
+            fetched = names + [ pk ]
+
+        rows = list(self.iterate_queryset(self.data.values_list(*fetched),
+                                          operator.itemgetter(fetched.index(pk))))
+        data = { }
+
+        for name, values in zip(names, zip(*rows) or [ () ] * len(names)):
+            data[name] = self.encode_column(values)
+
+        return data
+
+    def encode_column(self, values):
+        """
+        What `construct` makes of a column of raw values.
+        Columns of plain numbers and strings are left alone.
+        """
+        if set(map(type, values)) <= NATIVE_COLUMN_TYPES:
+            return list(values)
+
+        emitter = type(self)(list(values), self.typemapper, self.handler,
+                             anonymous=self.anonymous)
+        return emitter.construct()
+
+    def render(self, request=None):
+        cb = self.callback(request)
+        columns, data = self.table(request)
+        seria = self.dumps({ 'columns': columns, 'data': data }, self.pretty(request))
+
+        if cb:
+            return '%s(%s)' % (cb, seria)
+
+        return seria
+
+    def stream_render(self, request, stream=True):
+        yield self.render(request)
+
+# JavaScript typed arrays for integer columns, by range.
+INT_ARRAYS = [ (name, code, -2 ** (8 * size - 1), 2 ** (8 * size - 1))
+               for name, code, size in (('int8', 'b', 1), ('int16', 'h', 2), ('int32', 'i', 4))
+               if array.array(code).itemsize == size ]
+
+class TypedColumnarEmitter(ColumnarEmitter):
+    """
+    Binary variant of `ColumnarEmitter`, with numeric
+    columns packed as little-endian typed arrays, which
+    clients can map without parsing anything. The layout
+    is:
+
+     - the length of the header, a little-endian uint32.
+     - the header, a JSON object:
+
+        {"columns": [...], "length": <rows>,
+         "data": {<columns that aren't packed>: [...]},
+         "arrays": {<column>: {"type": "int8", "int16",
+                               "int32" or "float64",
+                               "offset": ..., "length": ...}}}
+
+       padded with spaces so what follows starts on an
+       8 byte boundary.
+     - the packed columns, at `offset` bytes from the
+       end of the header, each aligned to its item size.
+
+    Columns are packed when they're all numbers (no
+    nulls or booleans): integers into the smallest
+    integer array that holds them (float64 past int32),
+    anything with a float into float64.
+    """
+    def pack(self, values):
+        """
+        Returns (type, `array.array`) for `values`, or `None`
+        if they're left to the JSON header.
+        """
+        kinds = set(map(type, values))
+
+        if not values or not kinds <= set([ int, long, float ]):
+            return None
+
+        if float not in kinds:
+            low, high = min(values), max(values)
+
+            for name, code, lower, upper in INT_ARRAYS:
+                if lower <= low and high < upper:
+                    return (name, array.array(code, values))
+
+            # Past 2 ** 53, doubles aren't exact anymore.
+            if -2 ** 53 > low or high > 2 ** 53:
+                return None
+
+        return ('float64', array.array('d', values))
+
+    def render(self, request=None):
+        columns, data = self.table(request)
+        header = { 'columns': columns, 'data': { }, 'arrays': { },
+                   'length': columns and len(data[columns[0]]) or 0 }
+        arrays, offset = [ ], 0
+
+        for column in columns:
+            packed = self.pack(data[column])
+
+            if packed is None:
+                header['data'][column] = data[column]
+                continue
+
+            name, values = packed
+
+            if sys.byteorder == 'big':
+                values.byteswap()
+
+            padding = -offset % values.itemsize
+            arrays.append('\0' * padding + values.tostring())
+            offset += padding
+
+            header['arrays'][column] = { 'type': name, 'offset': offset,
+                                         'length': len(values) }
+            offset += len(values) * values.itemsize
+
+        header = smart_str(self.dumps(header))
+        header += ' ' * (-(len(header) + 4) % 8)
+
+        return struct.pack('<I', len(header)) + header + ''.join(arrays)
+
+Emitter.register('columnar', ColumnarEmitter, 'application/json; charset=utf-8')
+Emitter.register('columnar-binary', TypedColumnarEmitter, 'application/x-piston-columnar')
+
 class DjangoEmitter(Emitter):
     """
     Emitter for the Django serialized format.
@@ -1,12 +1,106 @@
-import warnings
+import warnings, itertools
 
+import caching, pagination
 from utils import rc
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, FieldError
 from django.db.models import ForeignKey, Model
 from django.conf import settings
 from django.views.decorators.http import condition as django_condition
 
-typemapper = { }
+class HandlerRegistry(dict):
+    """
+    The `typemapper`: a dict of handler class ->
+    (model, is_anonymous, default_for_model), which
+    also keeps an index by (model, is_anonymous) and
+    one by handler name, so looking a handler up
+    doesn't mean scanning every registered handler.
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self)
+        self.models = { }
+        self.names = { }
+        self.order = { }
+        self.registrations = itertools.count()
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, klass, value):
+        if klass in self:
+            del self[klass]
+
+        dict.__setitem__(self, klass, value)
+        self.order[klass] = self.registrations.next()
+        self._index(klass, value)
+
+    def __delitem__(self, klass):
+        value = self[klass]
+        dict.__delitem__(self, klass)
+        del self.order[klass]
+        self._unindex(klass, value)
+
+    def _index(self, klass, (model, anon, default)):
+        # The first handler registered for a model is the one,
+        # unless a later one is its `default_for_model`.
+        current = self.models.get((model, anon))
+
+        if current is None or (default and not self[current][2]):
+            self.models[(model, anon)] = klass
+
+        self.names[klass.__name__] = klass
+
+    def _unindex(self, klass, (model, anon, default)):
+        if self.models.get((model, anon)) is klass:
+            del self.models[(model, anon)]
+        if self.names.get(klass.__name__) is klass:
+            del self.names[klass.__name__]
+
+        # Someone else may have been shadowed by `klass`.
+        for k in sorted(self, key=self.order.get):
+            if self[k][:2] == (model, anon):
+                self._index(k, self[k])
+            if k.__name__ == klass.__name__:
+                self.names.setdefault(k.__name__, k)
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).iteritems():
+            self[k] = v
+
+    def setdefault(self, klass, value=None):
+        if klass not in self:
+            self[klass] = value
+        return self[klass]
+
+    def pop(self, klass, *default):
+        if klass not in self and default:
+            return default[0]
+        value = self[klass]
+        del self[klass]
+        return value
+
+    def popitem(self):
+        klass, value = dict.popitem(self)
+        del self.order[klass]
+        self._unindex(klass, value)
+        return klass, value
+
+    def clear(self):
+        dict.clear(self)
+        self.models.clear()
+        self.names.clear()
+        self.order.clear()
+
+    def for_model(self, model, anonymous):
+        """
+        Returns the handler registered for `model`, or `None`.
+        """
+        return self.models.get((model, anonymous))
+
+    def for_name(self, name):
+        """
+        Returns the registered handler called `name`, or `None`.
+        """
+        return self.names.get(name)
+
+typemapper = HandlerRegistry()
 handler_tracker = [ ]
 
 class HandlerMetaClass(type):
@@ -28,13 +122,22 @@ class HandlerMetaClass(type):
             new_cls.default_for_model = False
 
         def already_registered(model, anon):
-            for k, (m, a, d) in typemapper.iteritems():
-                if model == m and anon == a:
-                    return (k, d)
+            k = typemapper.for_model(model, anon)
+
+            if k is not None:
+                return (k, typemapper[k][2])
 
             return (None, False)
 
+        if getattr(new_cls, 'conditional', False) or getattr(new_cls, 'response_cache', None) \
+                or getattr(new_cls, 'page_count', None) in ('exact', 'estimate'):
+            for model in caching.handler_models(new_cls):
+                caching.track(model)
+
         if hasattr(new_cls, 'model'):
+            if getattr(new_cls, 'fragment_cache', False):
+                caching.watch(new_cls.model)
+
             (old_cls, default) = already_registered(new_cls.model, new_cls.is_anonymous)
 
             if old_cls and default == new_cls.default_for_model:
@@ -71,6 +174,22 @@ class BaseHandler(object):
     exclude = ( 'id', )
     fields =  ( )
     default_for_model = False
+    auto_related = True
+    auto_only = False
+    field_selection = False
+    fragment_cache = False
+    response_cache = None
+    response_cache_stale = 0
+    response_cache_gzip = False
+    conditional = False
+    depends_on = ( )
+    page_size = None
+    max_page_size = 100
+    page_ordering = ( 'pk', )
+    page_links = 'payload'
+    page_count = None
+    page_count_threshold = 100000
+    page_count_timeout = None
 
     def flatten_dict(self, dct):
         return dict([ (str(k), dct.get(k)) for k in dct.keys() ])
@@ -118,7 +237,30 @@ class BaseHandler(object):
             except MultipleObjectsReturned: # should never happen, since we're using a PK
                 return rc.BAD_REQUEST
         else:
-            return self.queryset(request).filter(*args, **kwargs)
+            return self.paginate(request, self.queryset(request).filter(*args, **kwargs))
+
+    def paginate(self, request, queryset):
+        """
+        Returns a page of `queryset` if `page_size` is set,
+        with keyset pagination over `page_ordering` (see
+        `piston.pagination`), or the whole `queryset` if not.
+        Bad `cursor` or `limit` parameters get a 400. The
+        page has the size of `queryset` if `page_count` is
+        set (see `pagination.count`.)
+        """
+        if not self.page_size:
+            return queryset
+
+        try:
+            page = pagination.paginate(request, queryset, self.page_ordering,
+                                       self.page_size, self.max_page_size, self.page_links)
+        except ValueError, e:
+            resp = rc.BAD_REQUEST
+            resp.content = '%s.' % e
+            return resp
+
+        page.total, page.estimated = pagination.count(queryset, self)
+        return page
 
     def create(self, request, *args, **kwargs):
         if not self.has_model():
@@ -0,0 +1,140 @@
+"""
+JSON encoder backends for the emitters.
+
+Which one is used is up to `PISTON_JSON_BACKEND`:
+
+ - 'simplejson': the `simplejson` package (with its C
+   speedups, when they're compiled.)
+ - 'json': the standard library `json` module.
+ - 'django': `django.utils.simplejson` with Django's
+   `DateTimeAwareJSONEncoder`, which is what Piston
+   always used.
+ - 'auto' (the default): `simplejson` if its speedups are
+   available, `json` otherwise.
+
+Other backends can be added with `register_backend`.
+"""
+from __future__ import absolute_import
+
+import datetime, decimal
+
+from django.conf import settings
+from django.utils import datetime_safe
+
+class JSONBackend(object):
+    """
+    Encodes with `module`, which has to look like the
+    standard library `json` module. Dates, times and
+    decimals are encoded like `DateTimeAwareJSONEncoder`
+    would.
+
+    Compact output leaves out all optional whitespace,
+    which is also what lets the C encoders do the work.
+    """
+    DATE_FORMAT = "%Y-%m-%d"
+    TIME_FORMAT = "%H:%M:%S"
+
+    def __init__(self, module, encoder=None):
+        self.module = module
+
+        if encoder is None:
+            encoder = type('PistonJSONEncoder', (module.JSONEncoder,),
+                           { 'default': self.encode_default })
+
+        self.encoder = encoder
+
+    def encode_default(self, o):
+        if isinstance(o, datetime.datetime):
+            d = datetime_safe.new_datetime(o)
+            return d.strftime("%s %s" % (self.DATE_FORMAT, self.TIME_FORMAT))
+        elif isinstance(o, datetime.date):
+            return datetime_safe.new_date(o).strftime(self.DATE_FORMAT)
+        elif isinstance(o, datetime.time):
+            return o.strftime(self.TIME_FORMAT)
+        elif isinstance(o, decimal.Decimal):
+            return str(o)
+
+        raise TypeError("%r is not JSON serializable" % (o,))
+
+    def dumps(self, data, pretty=False):
+        if pretty:
+            return self.module.dumps(data, cls=self.encoder,
+                                     ensure_ascii=False, indent=4)
+
+        return self.module.dumps(data, cls=self.encoder,
+                                 ensure_ascii=False, separators=(',', ':'))
+
+    def loads(self, data):
+        return self.module.loads(data)
+
+    @staticmethod
+    def is_native(module):
+        return getattr(module.encoder, 'c_make_encoder', None) is not None
+
+def simplejson_backend():
+    import simplejson
+    return JSONBackend(simplejson)
+
+def json_backend():
+    import json
+    return JSONBackend(json)
+
+def django_backend():
+    from django.utils import simplejson
+    from django.core.serializers.json import DateTimeAwareJSONEncoder
+    return JSONBackend(simplejson, DateTimeAwareJSONEncoder)
+
+def auto_backend():
+    try:
+        import simplejson
+    except ImportError:
+        pass
+    else:
+        if JSONBackend.is_native(simplejson):
+            return JSONBackend(simplejson)
+
+    try:
+        return json_backend()
+    except ImportError:
+        return django_backend()
+
+BACKENDS = {
+    'simplejson': simplejson_backend,
+    'json': json_backend,
+    'django': django_backend,
+    'auto': auto_backend,
+}
+
+def register_backend(name, factory):
+    """
+    Register a JSON backend. `factory` is called without
+    arguments and returns a `JSONBackend` (or anything with
+    `dumps(data, pretty=False)` and `loads(data)`.)
+    """
+    BACKENDS[name] = factory
+    _backends.clear()
+
+_backends = { }
+
+def get_backend(name=None):
+    """
+    Returns the (cached) backend called `name`, defaulting
+    to `PISTON_JSON_BACKEND` or 'auto'.
+    """
+    if name is None:
+        name = getattr(settings, 'PISTON_JSON_BACKEND', 'auto')
+
+    backend = _backends.get(name)
+
+    if backend is None:
+        try:
+            factory = BACKENDS[name]
+        except KeyError:
+            raise ValueError("No JSON backend called %s" % name)
+
+        backend = _backends[name] = factory()
+
+    return backend
+
+def loads(data):
+    return get_backend().loads(data)
@@ -1,5 +1,10 @@
+import itertools, zlib
+
+from django.conf import settings
 from django.middleware.http import ConditionalGetMiddleware
 from django.middleware.common import CommonMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.encoding import smart_str
 
 def compat_middleware_factory(klass):
     """
@@ -18,3 +23,148 @@ def compat_middleware_factory(klass):
 
 ConditionalMiddlewareCompatProxy = compat_middleware_factory(ConditionalGetMiddleware)
 CommonMiddlewareCompatProxy = compat_middleware_factory(CommonMiddleware)
+
+# Content codings we can produce, in order of preference,
+# with the `wbits` zlib needs for them.
+CODINGS = (('gzip', 16 + zlib.MAX_WBITS), ('deflate', zlib.MAX_WBITS))
+
+def accepted_encodings(header):
+    """
+    Parses an `Accept-Encoding` header into a dict of
+    content-coding -> qvalue.
+    """
+    accepted = { }
+
+    for part in header.split(','):
+        bits = part.split(';')
+        coding = bits[0].strip().lower()
+        q = 1.0
+
+        for param in bits[1:]:
+            name, _, value = param.partition('=')
+
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        if coding:
+            accepted[coding] = q
+
+    return accepted
+
+def negotiate_encoding(header):
+    """
+    Picks the coding to use for a request sending `header`
+    as its `Accept-Encoding`, or `None` for no compression.
+    """
+    accepted = accepted_encodings(header)
+    best, best_q = None, 0.0
+
+    for coding, wbits in CODINGS:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+
+        if q > best_q:
+            best, best_q = (coding, wbits), q
+
+    return best
+
+def compress_stream(chunks, compressor, charset, flush_size=8192):
+    """
+    Compresses `chunks` as they come, flushing at the end of
+    a chunk once `flush_size` bytes went in since the last
+    flush, so the client gets data soon without every small
+    chunk costing a flush.
+    """
+    pending = 0
+
+    for chunk in chunks:
+        chunk = smart_str(chunk, charset)
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+
+        if pending >= flush_size:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+class CompressionMiddleware(object):
+    """
+    Compresses responses with gzip or deflate, whichever
+    the client prefers. Unlike Django's `GZipMiddleware`,
+    this also deals with the generators `Resource` sends
+    when streaming: they're compressed chunk by chunk as
+    they're produced, rather than being read up front.
+
+    Settings:
+     - `PISTON_COMPRESSION_LEVEL`: zlib level, 1-9 (default 6.)
+     - `PISTON_COMPRESSION_MIN_SIZE`: responses smaller than
+       this many bytes are left alone (default 200.) For
+       streams, only enough of the output to tell is read.
+     - `PISTON_COMPRESSION_FLUSH_SIZE`: streams are flushed
+       at the end of a chunk once this many bytes went in
+       since the last flush (default 8192.)
+
+    Responses without a body (informational, 204 and 304)
+    aren't touched. A strong `ETag` is made weak, since the
+    compressed body isn't the one it was computed for.
+    """
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+        if encoding is None:
+            return response
+
+        coding, wbits = encoding
+        level = getattr(settings, 'PISTON_COMPRESSION_LEVEL', 6)
+        min_size = getattr(settings, 'PISTON_COMPRESSION_MIN_SIZE', 200)
+        compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+        if getattr(response, 'streaming', False):
+            chunks = iter(response._container)
+            head, size = [ ], 0
+
+            for chunk in chunks:
+                chunk = smart_str(chunk, response._charset)
+                head.append(chunk)
+                size += len(chunk)
+
+                if size >= min_size:
+                    break
+
+            if not size or size < min_size:
+                response.content = ''.join(head)
+                return response
+
+            flush_size = getattr(settings, 'PISTON_COMPRESSION_FLUSH_SIZE', 8192)
+            response._container = compress_stream(itertools.chain(head, chunks),
+                compressor, response._charset, flush_size)
+            response._is_string = False
+
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            if not response.content or len(response.content) < min_size:
+                return response
+
+            response.content = compressor.compress(response.content) + compressor.flush()
+            response['Content-Length'] = str(len(response.content))
+
+        if response.has_header('ETag') and response['ETag'].startswith('"'):
+            response['ETag'] = 'W/' + response['ETag']
+
+        response['Content-Encoding'] = coding
+        return response
@@ -0,0 +1,314 @@
+"""
+Keyset ("cursor") pagination for `BaseHandler.read`.
+
+Pages are fetched by seeking past the last row of the
+previous page on the handler's `page_ordering`, rather than
+with an OFFSET, so a page deep into the collection costs the
+same as the first one, and no COUNT is ever needed: asking
+for one row more than the page holds tells whether there's
+a next page.
+
+Clients go from page to page with the opaque `cursor` of the
+`next`/`prev` links, and can ask for `limit` rows per page,
+up to the handler's `max_page_size`. The links are in the
+payload (`{"items": [...], "next": ..., "prev": ...}`) or in
+a `Link` header, see `BaseHandler.page_links`.
+
+Ordering fields have to be plain, non-null columns of the
+model, and the last one should be unique; the primary key
+is added to break ties when it isn't.
+
+Pages only come with the size of the whole collection (as
+`total` in the payload and an `X-Total-Count` header) when
+the handler asks for it with `page_count`, see `count`.
+
+A page takes two queries: one for the ordering columns of
+its rows (and the one after), which the links are made of,
+and the page itself, left to the emitter as a QuerySet so
+it gets the same treatment (`select_related`, pruned
+columns, `values_list()` rows) as any other collection.
+"""
+import base64, urllib, re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.core.cache import cache
+from django.core.exceptions import ValidationError, ImproperlyConfigured
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.encoding import smart_str
+
+import json_backends, caching
+
+NEXT, PREV = 'n', 'p'
+
+class Page(object):
+    """
+    One page of a collection, as returned by `paginate`.
+    `items` is a QuerySet of the rows on the page, `next`
+    and `prev` are the URLs of the neighbouring pages, or
+    `None` at either end.
+    """
+    def __init__(self, items, next=None, prev=None, links='payload'):
+        self.items = items
+        self.next = next
+        self.prev = prev
+        self.links = links
+        self.total = None
+        self.estimated = False
+
+    def __emittable__(self):
+        ret = { 'items': self.items, 'next': self.next, 'prev': self.prev }
+
+        if self.total is not None:
+            ret['total'] = self.total
+
+        return ret
+
+    def link_header(self):
+        links = [ '<%s>; rel="%s"' % (url, rel)
+                  for rel, url in (('next', self.next), ('prev', self.prev)) if url ]
+
+        return ', '.join(links) or None
+
+def ordering_fields(model, ordering):
+    """
+    Resolves `ordering` (names, optionally prefixed with
+    '-') to a list of (field, descending), with the primary
+    key added at the end if nothing unique is there. Raises
+    `ImproperlyConfigured` for names we can't paginate on,
+    since those come from the handler, not the client.
+    """
+    meta = model._meta
+    fields = [ ]
+
+    for name in ordering:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+
+        if name == 'pk':
+            field = meta.pk
+        else:
+            try:
+                field = meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured("Can't paginate on unknown field %s" % name)
+
+        if field.rel:
+            raise ImproperlyConfigured("Can't paginate on relation %s" % name)
+
+        fields.append((field, descending))
+
+    if not fields or not fields[-1][0].unique:
+        descending = fields and fields[-1][1] or False
+
+        if meta.pk not in [ f for f, desc in fields ]:
+            fields.append((meta.pk, descending))
+
+    return fields
+
+def encode_cursor(direction, values):
+    data = [ direction ]
+
+    for value in values:
+        if not isinstance(value, (int, long, float, basestring)):
+            value = unicode(value)
+        data.append(value)
+
+    data = smart_str(json_backends.get_backend().dumps(data))
+
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+def decode_cursor(cursor, fields):
+    """
+    Returns (direction, values) for `cursor`, raising
+    `ValueError` if it isn't one of ours.
+    """
+    try:
+        data = base64.urlsafe_b64decode(smart_str(cursor) + '=' * (-len(cursor) % 4))
+        data = json_backends.get_backend().loads(data)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(data, list) or len(data) != len(fields) + 1 or \
+            data[0] not in (NEXT, PREV):
+        raise ValueError("Invalid cursor")
+
+    try:
+        values = [ field.to_python(value) for (field, desc), value in zip(fields, data[1:]) ]
+    except ValidationError:
+        raise ValueError("Invalid cursor")
+
+    return data[0], values
+
+def seek(fields, values, forward):
+    """
+    The filter for the rows after (or before, if not
+    `forward`) `values` in the ordering of `fields`.
+    """
+    q = None
+
+    for i, (field, descending) in enumerate(fields):
+        lookups = dict([ (f.name, v) for (f, d), v in zip(fields[:i], values) ])
+        lookups['%s__%s' % (field.name, descending == forward and 'lt' or 'gt')] = values[i]
+
+        if q is None:
+            q = Q(**lookups)
+        else:
+            q |= Q(**lookups)
+
+    return q
+
+def page_url(request, cursor, limit):
+    query = request.GET.copy()
+    query['cursor'] = cursor
+
+    if limit is not None:
+        query['limit'] = limit
+
+    # Sorted, so the same page always has the same URL.
+    query = urllib.urlencode([ (k, smart_str(v)) for k, values in sorted(query.lists())
+                               for v in values ])
+
+    return request.build_absolute_uri('%s?%s' % (request.path, query))
+
+def paginate(request, queryset, ordering, size, max_size, links='payload'):
+    """
+    Returns the `Page` of `queryset` that `request` asks
+    for (with its `cursor` and `limit` parameters), ordered
+    by `ordering`, with at most `max_size` rows (`None` for
+    no limit.) Raises `ValueError` on bad parameters,
+    `ImproperlyConfigured` on a bad `ordering`.
+    """
+    fields = ordering_fields(queryset.model, ordering)
+    limit = request.GET.get('limit')
+
+    if limit is not None:
+        try:
+            size = int(limit)
+        except ValueError:
+            raise ValueError("Invalid limit")
+
+        if size < 1:
+            raise ValueError("Invalid limit")
+
+    if max_size is not None:
+        size = min(size, max_size)
+    cursor = request.GET.get('cursor')
+    forward = True
+
+    if cursor:
+        direction, values = decode_cursor(cursor, fields)
+        forward = direction == NEXT
+        queryset = queryset.filter(seek(fields, values, forward))
+
+    order_by = [ (descending != (not forward) and '-' or '') + field.name
+                 for field, descending in fields ]
+    pk = queryset.model._meta.pk.attname
+    names = [ field.attname for field, descending in fields ]
+    columns = pk in names and names or names + [ pk ]
+    keys = list(queryset.order_by(*order_by).values_list(*columns)[:size + 1])
+    more = len(keys) > size
+    keys = keys[:size]
+
+    if not forward:
+        keys.reverse()
+
+    def link(direction, key):
+        return page_url(request, encode_cursor(direction, key[:len(names)]), limit)
+
+    order_by = [ (descending and '-' or '') + field.name for field, descending in fields ]
+    items = queryset.filter(pk__in=[ key[columns.index(pk)] for key in keys ]).order_by(*order_by)
+    page = Page(items[:size], links=links)
+
+    if keys:
+        if more or not forward:
+            page.next = link(NEXT, keys[-1])
+        if (more and not forward) or (forward and cursor):
+            page.prev = link(PREV, keys[0])
+
+    return page
+
+def count(queryset, handler):
+    """
+    The number of rows in `queryset`, by the `page_count`
+    strategy of `handler`, as a tuple of (count, estimated):
+
+     - 'exact': COUNT(*), cached for each filter until an
+       instance of one of the handler's models is saved or
+       deleted (see `caching.handler_models`), and at most
+       `page_count_timeout` seconds.
+     - 'estimate': the row count the database planner
+       estimates (PostgreSQL and MySQL), when it's over
+       `page_count_threshold`. Below that, or when there's
+       no estimate, like 'exact'.
+     - a handler method taking `queryset` and returning
+       the count.
+
+    Returns (None, False) if `page_count` isn't set.
+    """
+    strategy = getattr(handler, 'page_count', None)
+
+    if not strategy:
+        return (None, False)
+    elif callable(strategy):
+        return (strategy(queryset), False)
+
+    queryset = queryset.order_by()
+
+    try:
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return (0, False)
+
+    if strategy == 'estimate':
+        estimate = estimated_count(queryset.db, sql, params)
+
+        if estimate is not None and estimate >= handler.page_count_threshold:
+            return (estimate, True)
+
+    elif strategy != 'exact':
+        raise ValueError("Unknown page_count strategy %r" % (strategy,))
+
+    models = caching.handler_models(handler) or [ queryset.model ]
+
+    for model in models:
+        caching.track(model)
+
+    key = 'piston:count:%s' % caching.digest(queryset.db, sql, params,
+                                             caching.model_versions(models))
+    total = cache.get(key)
+
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, getattr(handler, 'page_count_timeout', None))
+
+    return (total, False)
+
+_plan_rows = re.compile(r'\brows=(\d+)')
+
+def estimated_count(using, sql, params):
+    """
+    The number of rows the planner expects `sql` to return,
+    or `None` if the database doesn't tell.
+    """
+    connection = connections[using]
+    vendor = getattr(connection, 'vendor', None)
+
+    if vendor not in ('postgresql', 'mysql'):
+        return None
+
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN ' + sql, params)
+    rows = cursor.fetchall()
+
+    if not rows:
+        return None
+
+    if vendor == 'postgresql':
+        match = _plan_rows.search(rows[0][0])
+        return match and int(match.group(1)) or None
+
+    # MySQL: the estimate of the first table scanned.
+    names = [ column[0] for column in cursor.description ]
+    return 'rows' in names and int(rows[0][names.index('rows')] or 0) or None
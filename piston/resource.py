@@ -1,20 +1,23 @@
-import sys, inspect
+import sys, inspect, datetime
 
 from django.http import (HttpResponse, Http404, HttpResponseNotAllowed,
     HttpResponseForbidden, HttpResponseServerError)
 from django.views.debug import ExceptionReporter
 from django.views.decorators.vary import vary_on_headers
+from django.views.decorators.http import condition
 from django.conf import settings
 from django.core.mail import send_mail, EmailMessage
 from django.db.models.query import QuerySet
 from django.http import Http404
 
+import caching
 from emitters import Emitter
 from handler import typemapper
 from doc import HandlerMethod
 from authentication import NoAuthentication
 from utils import coerce_put_post, FormValidationError, HttpStatusCode
-from utils import rc, format_error, translate_mime, MimerDataException
+from utils import rc, format_error, translate_mime, MimerDataException, Mimer
+from pagination import Page
 
 CHALLENGE = object()
 
@@ -89,9 +92,7 @@ class Resource(object):
             if callable(anon):
                 return anon
 
-            for klass in typemapper.keys():
-                if anon == klass.__name__:
-                    return klass
+            return typemapper.for_name(anon)
 
         return None
 
@@ -119,7 +120,10 @@ class Resource(object):
         """
         rm = request.method.upper()
 
-        if rm == 'POST':
+        # Bodies for streaming loaders are read by the handler.
+        streaming = Mimer(request).is_streaming()
+
+        if rm == 'POST' and not streaming:
             block = getattr(request, 'POST', { })
 
             # Support alternative request types via
@@ -135,7 +139,7 @@ class Resource(object):
 
         # Django's internal mechanism doesn't pick up
         # PUT request, so we trick it a little here.
-        elif rm == 'PUT':
+        elif rm == 'PUT' and not streaming:
             coerce_put_post(request)
 
         actor, anonymous = self.authenticate(request, rm)
@@ -174,40 +178,84 @@ class Resource(object):
         # don't want to pass these along to the handler.
         request = self.cleanup_request(request)
 
-        try:
-            result = meth(request, *args, **kwargs)
-        except Exception, e:
-            result = self.error_handler(e, request, meth, em_format)
-
         try:
             emitter, ct = Emitter.get(em_format)
-            fields = handler.fields
-
-            if hasattr(handler, 'list_fields') and isinstance(result, (list, tuple, QuerySet)):
-                fields = handler.list_fields
         except ValueError:
             result = rc.BAD_REQUEST
             result.content = "Invalid output format specified '%s'." % em_format
             return result
 
+        etag = last_modified = cache_key = None
 
-        # Create a fake controller we can
-        # use to test conditional headers
-        etag = last_modified = None
+        # Evaluate conditional headers with a fake controller
+        # before doing any work, so a 304 costs next to nothing.
         if hasattr(meth, 'piston_precondition_decorator'):
-            @meth.piston_precondition_decorator
-            def fake_controller(request, *args, **kwargs):
-                return rc.ALL_OK
+            response, etag, last_modified = self.precondition(
+                meth.piston_precondition_decorator, request, ct, *args, **kwargs)
 
-            response = fake_controller(request, *args, **kwargs)
-            response['Content-Type'] = ct
-            if response.status_code == 304:
+            if response is not None:
                 return response
 
-            if response.has_header('ETag'):
-                etag = response['ETag']
-            if response.has_header('Last-Modified'):
-                last_modified = response['Last-Modified']
+        conditional = getattr(handler, 'conditional', False) and \
+            caching.handler_models(handler) and \
+            not hasattr(meth, 'piston_precondition_decorator')
+        cached = getattr(handler, 'response_cache', None) and not self.stream
+
+        if rm == 'GET' and (conditional or cached):
+            signature = self.request_signature(request, handler, anonymous, em_format)
+
+            if conditional:
+                response, etag, last_modified = self.precondition(
+                    self.version_condition(signature), request, ct, *args, **kwargs)
+
+                if response is not None:
+                    return response
+
+            if cached:
+                cache_key = caching.response_key(*signature)
+                response = caching.cached_response(cache_key, handler, request)
+
+                if response is not None:
+                    return response
+
+        try:
+            result = meth(request, *args, **kwargs)
+        except Exception, e:
+            result = self.error_handler(e, request, meth, em_format)
+
+        page = None
+
+        # Pages are emitted as a collection, with their links
+        # in the payload or in a `Link` header. Either way the
+        # items go through the handler's fields, see below.
+        if isinstance(result, Page):
+            page = result
+
+            if page.links == 'header':
+                result = page.items
+            else:
+                result = page.__emittable__()
+
+        fields = handler.fields
+
+        if hasattr(handler, 'list_fields') and \
+                (page is not None or isinstance(result, (list, tuple, QuerySet))):
+            fields = handler.list_fields
+
+        if getattr(handler, 'field_selection', False) and request.GET.get('fields'):
+            try:
+                selectable = result
+
+                # What's selected from are the items of pages.
+                if page is not None:
+                    selectable = page.items
+
+                fields = self.select_fields(request.GET['fields'],
+                    emitter(selectable, typemapper, handler, fields, anonymous), fields)
+            except ValueError, e:
+                result = rc.BAD_REQUEST
+                result.content = e.args[0]
+                return result
 
         status_code = 200
 
@@ -247,12 +295,127 @@ class Resource(object):
             if last_modified:
                 resp['Last-Modified'] = last_modified
 
+            if page is not None:
+                if page.links == 'header' and page.link_header():
+                    resp['Link'] = page.link_header()
+
+                if page.total is not None:
+                    resp['X-Total-Count'] = str(page.total)
+
+                    if page.estimated:
+                        resp['X-Total-Count-Estimated'] = 'true'
+
             resp.streaming = self.stream
 
+            if cache_key and resp.status_code == 200:
+                caching.cache_response(cache_key, handler, resp)
+
             return resp
         except HttpStatusCode, e:
             return e.response
 
+    @staticmethod
+    def select_fields(selection, srl, fields):
+        """
+        Narrows `fields` down to the comma separated names in
+        `selection` (the `?fields=` of handlers with
+        `field_selection` set.) Only what the handler emits
+        for the payload of emitter `srl` can be selected,
+        anything else raises `ValueError`. Nested specs in
+        `fields` are kept for the names selected, and the
+        result is in the handler's order whatever the order
+        of `selection`, so permutations share a `FieldPlan`.
+        """
+        names = srl.plan_columns()
+
+        if names is None:
+            return fields
+
+        nested = dict([ f for f in fields if isinstance(f, (list, tuple)) ])
+        selected = [ ]
+
+        for name in selection.split(','):
+            name = name.strip()
+
+            if name not in names:
+                raise ValueError("Unknown field '%s'." % name)
+
+            if name not in selected:
+                selected.append(name)
+
+        selected.sort(key=names.index)
+
+        return tuple([ name in nested and (name, nested[name]) or name
+                       for name in selected ])
+
+    def request_signature(self, request, handler, anonymous, em_format):
+        """
+        What the response to GET `request` depends on: the
+        handler, the path, the query, the output format, who's
+        asking (the user, or the credentials if the authenticator
+        didn't set one) and the versions of the handler's models
+        (see `caching.handler_models`.)
+
+        Used as the key of cached responses and for the ETag
+        of `conditional` handlers.
+        """
+        user = getattr(request, 'user', None)
+
+        if anonymous or (user is not None and not user.is_authenticated()):
+            identity = None
+        elif user is not None:
+            identity = user.pk
+        else:
+            identity = request.META.get('HTTP_AUTHORIZATION')
+
+        models = caching.handler_models(handler)
+
+        for model in models:
+            caching.track(model)
+
+        if hasattr(request.GET, 'lists'):
+            query = sorted(request.GET.lists())
+        else:
+            query = sorted(request.GET.items())
+
+        return (type(handler).__name__, request.path, query, em_format,
+                identity, caching.model_versions(models))
+
+    @staticmethod
+    def version_condition(signature):
+        """
+        A `condition` decorator for `conditional` handlers,
+        with the ETag and Last-Modified following from the
+        model versions in `signature`.
+        """
+        versions = signature[-1]
+        etag = caching.digest(*signature)
+        last_modified = datetime.datetime.utcfromtimestamp(max(versions))
+
+        return condition(etag_func=lambda *args, **kwargs: etag,
+                         last_modified_func=lambda *args, **kwargs: last_modified)
+
+    @staticmethod
+    def precondition(decorator, request, ct, *args, **kwargs):
+        """
+        Runs a fake controller decorated with `decorator`
+        (see `piston.handler.condition`) to evaluate the
+        conditional headers of `request`. Returns a tuple of
+        (response to send right away, ETag, Last-Modified),
+        the first of which is `None` unless it's a 304.
+        """
+        @decorator
+        def fake_controller(request, *args, **kwargs):
+            return rc.ALL_OK
+
+        response = fake_controller(request, *args, **kwargs)
+        response['Content-Type'] = ct
+
+        if response.status_code == 304:
+            return response, None, None
+
+        return None, response.get('ETag', None), response.get('Last-Modified', None)
+
     @staticmethod
     def cleanup_request(request):
         """
@@ -318,6 +481,9 @@ class Resource(object):
         elif isinstance(e, HttpStatusCode):
             return e.response
 
+        elif isinstance(e, MimerDataException):
+            return rc.BAD_REQUEST
+
         else:
             """
             On errors (like code errors), we'd like to be able to
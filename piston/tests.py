@@ -9,7 +9,7 @@ from django.utils import simplejson
 # Piston imports
 from test import TestCase
 from models import Consumer
-from handler import BaseHandler
+from handler import BaseHandler, HandlerRegistry
 from utils import rc
 from resource import Resource
 
@@ -196,3 +196,758 @@ class ErrorHandlerTest(TestCase):
 
         self.assertTrue(isinstance(response, HttpResponse), "Expected a response, not: %s" 
             % response)
+
+
+class HandlerRegistryTest(TestCase):
+    def test_indexes_follow_the_dict(self):
+        class First(object): pass
+        class Second(object): pass
+
+        registry = HandlerRegistry()
+        registry[First] = (User, False, False)
+        registry[Second] = (User, True, False)
+
+        self.assertEquals(First, registry.for_model(User, False))
+        self.assertEquals(Second, registry.for_model(User, True))
+        self.assertEquals(Second, registry.for_name('Second'))
+
+        del registry[First]
+
+        self.assertEquals(None, registry.for_model(User, False))
+        self.assertEquals(None, registry.for_name('First'))
+        self.assertEquals({ Second: (User, True, False) }, dict(registry))
+
+    def test_first_handler_for_a_model(self):
+        from emitters import Emitter
+
+        class First(object): pass
+        class Second(object): pass
+        class Default(object): pass
+
+        registry = HandlerRegistry()
+        registry[First] = (User, False, False)
+        registry[Second] = (User, False, False)
+
+        self.assertEquals(First, registry.for_model(User, False))
+        self.assertEquals(First, Emitter(None, registry, None).in_typemapper(User, False))
+
+        registry[Default] = (User, False, True)
+        self.assertEquals(Default, registry.for_model(User, False))
+
+        del registry[Default]
+        self.assertEquals(First, registry.for_model(User, False))
+
+        del registry[First]
+        self.assertEquals(Second, registry.for_model(User, False))
+
+
+class StreamingJSONTest(TestCase):
+    def setUp(self):
+        class MyHandler(BaseHandler):
+            allowed_methods = ('GET',)
+
+            def read(self, request):
+                return ( { 'n': n } for n in range(1000) )
+
+        self.resource = Resource(MyHandler)
+        self.resource.stream = True
+
+    def test_generator_is_streamed(self):
+        request = HttpRequest()
+        request.method = 'GET'
+        response = self.resource(request, emitter_format='json')
+
+        self.assertTrue(response.streaming)
+        self.assertTrue(len(list(response._container)) > 1)
+
+    def test_streamed_jsonp(self):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.GET['callback'] = 'cb'
+        response = self.resource(request, emitter_format='json')
+
+        content = response.content
+        self.assertTrue(content.startswith('cb(['))
+        self.assertTrue(content.endswith('])'))
+        self.assertEquals([ { 'n': n } for n in range(1000) ],
+                          simplejson.loads(content[3:-1]))
+
+
+class DatetimeEncoderTest(TestCase):
+    def test_matches_pytz(self):
+        import datetime, pytz
+        from datetimes import LocalTimezone
+
+        for name in ('America/Chicago', 'Europe/London', 'Australia/Lord_Howe', 'UTC'):
+            tz = pytz.timezone(name)
+            local = LocalTimezone(tz)
+            dt = datetime.datetime(2009, 1, 1)
+
+            # Every half hour for a year, across both DST changes
+            while dt.year == 2009:
+                expected = tz.localize(dt).astimezone(pytz.utc).replace(tzinfo=None)
+                self.assertEquals(expected, local.to_utc(dt), '%s in %s' % (dt, name))
+                dt += datetime.timedelta(minutes=30)
+
+    def test_formats(self):
+        import datetime, pytz
+        from datetimes import datetime_encoder
+
+        dt = pytz.utc.localize(datetime.datetime(2010, 1, 31, 12, 0, 5))
+
+        self.assertEquals('2010-01-31 12:00:05 +0000', datetime_encoder()(dt))
+        self.assertEquals('2010-01-31T12:00:05Z', datetime_encoder('iso8601')(dt))
+        self.assertEquals(1264939205000, datetime_encoder('epoch_millis')(dt))
+        self.assertRaises(ValueError, datetime_encoder, 'nope')
+
+    def test_naive_datetimes_are_local(self):
+        import datetime, pytz
+        from datetimes import datetime_encoder
+
+        dt = datetime.datetime(2010, 7, 1, 12)
+        utc = pytz.timezone(settings.TIME_ZONE).localize(dt).astimezone(pytz.utc)
+
+        self.assertEquals(utc.strftime("%Y-%m-%d %H:%M:%S %z"), datetime_encoder()(dt))
+
+
+class TypeEncoderTest(TestCase):
+    def test_registered_encoder(self):
+        from emitters import Emitter, JSONEmitter
+        from handler import typemapper
+
+        class Point(object):
+            def __init__(self, x, y):
+                self.x, self.y = x, y
+
+        class Point3D(Point):
+            pass
+
+        data = { 'points': [ Point(1, 2), Point3D(3, 4) ] }
+
+        JSONEmitter.register_type(Point, lambda p: [ p.x, p.y ])
+        try:
+            constructed = JSONEmitter(data, typemapper, None).construct()
+            self.assertEquals({ 'points': [ [ 1, 2 ], [ 3, 4 ] ] }, constructed)
+
+            # Only for JSON
+            constructed = Emitter(data, typemapper, None).construct()
+            self.assertTrue(isinstance(constructed['points'][0], unicode))
+        finally:
+            JSONEmitter.unregister_type(Point)
+
+        self.assertTrue(isinstance(JSONEmitter(data, typemapper, None).construct()['points'][0], unicode))
+
+class JSONBackendTest(TestCase):
+    def test_backends_agree(self):
+        import datetime, decimal
+        from json_backends import get_backend
+
+        data = { 'a': [ 1, 2.5, None, True ], 'b': u'\xe6\xf8\xe5',
+                 'c': datetime.date(2010, 1, 31), 'd': datetime.time(12, 30),
+                 'e': decimal.Decimal('1.10') }
+
+        expected = get_backend('django').dumps(data, pretty=True)
+
+        for name in ('json', 'django', 'auto'):
+            backend = get_backend(name)
+            self.assertEquals(expected, backend.dumps(data, pretty=True))
+            self.assertEquals(simplejson.loads(expected),
+                              backend.loads(backend.dumps(data)))
+            self.assertTrue(' ' not in backend.dumps(data['a']))
+
+    def test_unknown_backend(self):
+        from json_backends import get_backend
+        self.assertRaises(ValueError, get_backend, 'nosuchbackend')
+
+    def test_pretty_parameter(self):
+        from emitters import JSONEmitter
+
+        request = HttpRequest()
+        emitter = JSONEmitter([ 1, 2 ], { }, BaseHandler())
+        self.assertEquals('[1,2]', emitter.render(request))
+
+        request.GET['pretty'] = '1'
+        self.assertEquals('[\n    1, \n    2\n]', emitter.render(request))
+
+class ResponseCacheTest(TestCase):
+    fixtures = ['models.json']
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        calls = self.calls = [ ]
+
+        class CachedHandler(BaseHandler):
+            model = Consumer
+            allowed_methods = ('GET',)
+            response_cache = 60
+            response_cache_stale = 60
+            response_cache_gzip = True
+
+            def read(self, request):
+                calls.append(request.GET.get('q'))
+                return { 'calls': len(calls) }
+
+        self.handler = CachedHandler
+        self.resource = Resource(CachedHandler)
+
+    def tearDown(self):
+        from handler import typemapper
+        del typemapper[self.handler]
+
+    def request(self, **params):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.GET.update(params)
+        return request
+
+    def get(self, **params):
+        return self.resource(self.request(**params), emitter_format='json')
+
+    def test_cached(self):
+        first = self.get()
+        self.assertEquals(first.content, self.get().content)
+        self.assertEquals([ None ], self.calls)
+
+        self.get(q='other')
+        self.assertEquals([ None, 'other' ], self.calls)
+
+    def test_invalidated_by_model_changes(self):
+        self.get()
+
+        consumer = Consumer(name='Test', description='Test', status='accepted',
+                            user=User.objects.get(pk=3))
+        consumer.generate_random_codes()
+        consumer.save()
+
+        self.get()
+        self.assertEquals([ None, None ], self.calls)
+
+    def test_stale_while_revalidate(self):
+        from django.core.cache import cache
+        from caching import response_key
+
+        def expire():
+            key = response_key(*self.resource.request_signature(
+                self.request(), self.resource.handler, False, 'json'))
+            entry = cache.get(key)
+            entry['created'] -= 90
+            cache.set(key, entry)
+            return key
+
+        self.get()
+        expire()
+
+        # The first request after expiry regenerates it...
+        self.assertEquals('{"calls":2}', self.get().content)
+
+        # ... while requests coming in meanwhile get the stale one.
+        key = expire()
+        cache.add(key + ':lock', 1)
+
+        self.assertEquals('{"calls":2}', self.get().content)
+        self.assertEquals(2, len(self.calls))
+
+    def test_gzip(self):
+        import gzip, StringIO
+
+        content = self.get().content
+
+        request = self.request()
+        request.META['HTTP_ACCEPT_ENCODING'] = 'gzip, deflate'
+        response = self.resource(request, emitter_format='json')
+
+        self.assertEquals('gzip', response['Content-Encoding'])
+        self.assertTrue('Accept-Encoding' in response['Vary'])
+        self.assertEquals(content, gzip.GzipFile(
+            fileobj=StringIO.StringIO(response.content)).read())
+
+class ConditionalHandlerTest(TestCase):
+    fixtures = ['models.json']
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        calls = self.calls = [ ]
+
+        class ConditionalHandler(BaseHandler):
+            model = Consumer
+            allowed_methods = ('GET',)
+            conditional = True
+
+            def read(self, request):
+                calls.append(request)
+                return Consumer.objects.count()
+
+        self.handler = ConditionalHandler
+        self.resource = Resource(ConditionalHandler)
+
+    def tearDown(self):
+        from handler import typemapper
+        del typemapper[self.handler]
+
+    def get(self, **headers):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.META.update(headers)
+        return self.resource(request, emitter_format='json')
+
+    def test_not_modified(self):
+        response = self.get()
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        result = [ ]
+        self.assertNumQueries(0, lambda: result.append(self.get(HTTP_IF_NONE_MATCH=etag)))
+        self.assertEquals(304, result[0].status_code)
+        self.assertEquals(1, len(self.calls))
+
+        consumer = Consumer(name='Test', description='Test', status='accepted',
+                            user=User.objects.get(pk=3))
+        consumer.generate_random_codes()
+        consumer.save()
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(200, response.status_code)
+        self.assertNotEquals(etag, response['ETag'])
+        self.assertEquals(2, len(self.calls))
+
+    def test_depends_on(self):
+        from caching import touch
+
+        self.handler.depends_on = (User,)
+        try:
+            etag = self.get()['ETag']
+            self.assertEquals(304, self.get(HTTP_IF_NONE_MATCH=etag).status_code)
+
+            touch(User)
+            self.assertEquals(200, self.get(HTTP_IF_NONE_MATCH=etag).status_code)
+        finally:
+            self.handler.depends_on = ()
+
+class PreconditionTest(TestCase):
+    def setUp(self):
+        from handler import etag
+
+        calls = self.calls = [ ]
+
+        class EtagHandler(BaseHandler):
+            allowed_methods = ('GET',)
+
+            @etag(lambda request: 'v1')
+            def read(self, request):
+                calls.append(request)
+                return 'content'
+
+        self.resource = Resource(EtagHandler)
+
+    def get(self, **headers):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.META.update(headers)
+        return self.resource(request, emitter_format='json')
+
+    def test_not_modified_skips_handler(self):
+        response = self.get(HTTP_IF_NONE_MATCH='"v1"')
+        self.assertEquals(304, response.status_code)
+        self.assertEquals([ ], self.calls)
+
+        response = self.get(HTTP_IF_NONE_MATCH='"v0"')
+        self.assertEquals(200, response.status_code)
+        self.assertEquals('"v1"', response['ETag'])
+        self.assertEquals(1, len(self.calls))
+
+class CompressionMiddlewareTest(TestCase):
+    def compress(self, response, accept='gzip, deflate'):
+        from middleware import CompressionMiddleware
+
+        request = HttpRequest()
+        request.META['HTTP_ACCEPT_ENCODING'] = accept
+        return CompressionMiddleware().process_response(request, response)
+
+    def test_negotiation(self):
+        from middleware import negotiate_encoding
+
+        self.assertEquals('gzip', negotiate_encoding('gzip, deflate')[0])
+        self.assertEquals('deflate', negotiate_encoding('gzip;q=0.5, deflate')[0])
+        self.assertEquals('deflate', negotiate_encoding('gzip;q=0, *')[0])
+        self.assertEquals(None, negotiate_encoding('identity'))
+        self.assertEquals(None, negotiate_encoding(''))
+
+    def test_buffered(self):
+        import zlib
+
+        content = '{"n":1},' * 100
+        response = self.compress(HttpResponse(content), 'deflate')
+
+        self.assertEquals('deflate', response['Content-Encoding'])
+        self.assertEquals(content, zlib.decompress(response.content))
+        self.assertEquals(str(len(response.content)), response['Content-Length'])
+
+    def test_streamed(self):
+        import zlib
+
+        chunks = [ u'{"n":%d},' % n for n in range(1000) ]
+        response = HttpResponse(iter(chunks))
+        response.streaming = True
+        response = self.compress(response)
+
+        self.assertEquals('gzip', response['Content-Encoding'])
+        compressed = list(response)
+        self.assertTrue(len(compressed) > 1)
+        self.assertEquals(u''.join(chunks),
+            zlib.decompress(''.join(compressed), 16 + zlib.MAX_WBITS))
+
+    def test_small_and_encoded_left_alone(self):
+        response = HttpResponse(iter([ 'a', 'b' ]))
+        response.streaming = True
+        response = self.compress(response)
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEquals('ab', response.content)
+
+        response = HttpResponse('x' * 1000)
+        response['Content-Encoding'] = 'gzip'
+        self.assertEquals('x' * 1000, self.compress(response).content)
+
+    def test_no_body_left_alone(self):
+        for status in (100, 204, 304):
+            response = HttpResponse('x' * 1000, status=status)
+            self.assertFalse(self.compress(response).has_header('Content-Encoding'))
+
+        response = HttpResponse(iter([ ]))
+        response.streaming = True
+        setattr(settings, 'PISTON_COMPRESSION_MIN_SIZE', 0)
+        try:
+            response = self.compress(response)
+        finally:
+            del settings.PISTON_COMPRESSION_MIN_SIZE
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEquals('', response.content)
+
+    def test_etag_made_weak(self):
+        response = HttpResponse('x' * 1000)
+        response['ETag'] = '"abc"'
+        self.assertEquals('W/"abc"', self.compress(response)['ETag'])
+
+        response = HttpResponse('x' * 1000)
+        response['ETag'] = 'W/"abc"'
+        self.assertEquals('W/"abc"', self.compress(response)['ETag'])
+
+    def test_stream_flushes(self):
+        import zlib
+        from middleware import compress_stream
+
+        chunks = [ 'x' * 100 ] * 100
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = list(compress_stream(iter(chunks), compressor, 'utf-8', 2500))
+
+        # A flush every 25 chunks, and the final one.
+        self.assertEquals(5, len(compressed))
+        self.assertEquals(''.join(chunks), zlib.decompress(''.join(compressed), -zlib.MAX_WBITS))
+
+class CBORTest(TestCase):
+    def test_rfc_examples(self):
+        import cbor
+
+        for value, encoded in ((0, '00'), (1000000, '1a000f4240'), (-1000, '3903e7'),
+                               (18446744073709551616, 'c249010000000000000000'),
+                               (u'\xfc', '62c3bc'), ([ 1, [ 2, 3 ] ], '8201820203'),
+                               (True, 'f5'), (None, 'f6'), (1.1, 'fb3ff199999999999a')):
+            self.assertEquals(encoded, cbor.dumps(value).encode('hex'))
+            self.assertEquals(value, cbor.loads(encoded.decode('hex')))
+
+        self.assertEquals(1.0, cbor.loads('f93c00'.decode('hex')))
+        self.assertEquals([ 1, [ 2, 3 ] ], cbor.loads('9f018202039fffff'.decode('hex'))[:2])
+        self.assertEquals({ u'a': 1 }, cbor.loads('bf6161 01ff'.replace(' ', '').decode('hex')))
+        self.assertEquals('\x01\x02\x03', cbor.loads('5f42010241 03ff'.replace(' ', '').decode('hex')))
+
+    def test_native_types(self):
+        import cbor, datetime, decimal, pytz
+
+        dt = datetime.datetime(2013, 3, 21, 20, 4, 0, tzinfo=pytz.utc)
+        self.assertEquals('c11a514b67b0', cbor.dumps(dt).encode('hex'))
+        self.assertEquals(dt, cbor.loads(cbor.dumps(dt)))
+
+        self.assertEquals('c48221196ab3', cbor.dumps(decimal.Decimal('273.15')).encode('hex'))
+        self.assertEquals(decimal.Decimal('-273.15'),
+                          cbor.loads(cbor.dumps(decimal.Decimal('-273.15'))))
+
+        self.assertEquals('43010203', cbor.dumps(bytearray('\x01\x02\x03')).encode('hex'))
+        self.assertEquals(datetime.date(2010, 1, 31), cbor.loads(cbor.dumps(datetime.date(2010, 1, 31))))
+
+    def test_malformed(self):
+        import cbor
+
+        for data in ('', '1a000f', '62c3', '9f01', 'a16161', 'ff', '1f', '81' * 1000 + '00',
+                     '9b7fffffffffffffff', 'a1' + '80' + '01', '0000'):
+            self.assertRaises(ValueError, cbor.loads, data.decode('hex'))
+
+    def test_emitter(self):
+        import cbor, decimal
+        from emitters import Emitter
+
+        emitter, ct = Emitter.get('cbor')
+        data = [ { 'n': n, 'd': decimal.Decimal('1.5') } for n in range(1000) ]
+
+        rendered = emitter(data, { }, None).render(HttpRequest())
+        streamed = list(emitter(data, { }, None).stream_render(HttpRequest()))
+
+        self.assertEquals('application/cbor', ct)
+        self.assertTrue(len(streamed) > 1)
+        self.assertEquals(data, cbor.loads(rendered))
+        self.assertEquals(data, cbor.loads(''.join(streamed)))
+
+    def test_emitter_binary_str(self):
+        import cbor
+        from emitters import Emitter
+
+        emitter = Emitter.get('cbor')[0]
+        data = { 'blob': '\x89PNG\xff\xfe', 'text': 'caf\xc3\xa9' }
+        decoded = cbor.loads(emitter(data, { }, None).render(HttpRequest()))
+
+        self.assertEquals('\x89PNG\xff\xfe', decoded['blob'])
+        self.assertEquals(u'caf\xe9', decoded['text'])
+
+    def test_loader(self):
+        import cbor
+        from utils import translate_mime
+
+        request = HttpRequest()
+        request.META['CONTENT_TYPE'] = 'application/cbor'
+        request._raw_post_data = cbor.dumps({ 'title': u'foo' })
+        translate_mime(request)
+
+        self.assertEquals({ u'title': u'foo' }, request.data)
+
+class NDJSONTest(TestCase):
+    def test_emitter(self):
+        from emitters import Emitter
+
+        emitter, ct = Emitter.get('ndjson')
+        data = [ { 'n': n } for n in range(1000) ]
+
+        rendered = emitter(data, { }, None).render(HttpRequest())
+        streamed = list(emitter(data, { }, None).stream_render(HttpRequest()))
+
+        self.assertEquals('application/x-ndjson; charset=utf-8', ct)
+        self.assertTrue(len(streamed) > 1)
+        self.assertEquals(rendered, ''.join(streamed))
+        self.assertEquals('{"n":0}\n{"n":1}\n', rendered[:16])
+        self.assertEquals(data, [ simplejson.loads(line) for line in rendered.splitlines() ])
+
+    def test_loader(self):
+        from django.test.client import RequestFactory
+
+        seen = [ ]
+
+        class RecordHandler(BaseHandler):
+            allowed_methods = ('POST',)
+
+            def create(self, request):
+                # Records are parsed as they're iterated over.
+                self.lazy = not isinstance(request.data, (list, tuple))
+
+                for record in request.data:
+                    seen.append(record)
+
+                return { 'lazy': self.lazy }
+
+        body = '{"a":1}\n\n{"a":2}\n'
+        request = RequestFactory().post('/records', body, content_type='application/x-ndjson')
+        response = Resource(RecordHandler)(request, emitter_format='json')
+
+        self.assertEquals(200, response.status_code)
+        self.assertEquals('{"lazy":true}', response.content)
+        self.assertEquals([ { 'a': 1 }, { 'a': 2 } ], seen)
+
+        request = RequestFactory().post('/records', '{"a":1}\n{"a":\n',
+                                        content_type='application/x-ndjson')
+        response = Resource(RecordHandler)(request, emitter_format='json')
+
+        self.assertEquals(400, response.status_code)
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        for n in range(7):
+            Consumer(name='c%d' % (n % 3), description='', status='accepted').save()
+
+        class PagedHandler(BaseHandler):
+            model = Consumer
+            allowed_methods = ('GET',)
+            fields = ('id', 'name')
+            page_size = 3
+            max_page_size = 4
+            page_ordering = ('-name',)
+
+        self.handler = PagedHandler
+        self.resource = Resource(PagedHandler)
+
+    def tearDown(self):
+        from handler import typemapper
+        del typemapper[self.handler]
+
+    def get(self, url='/consumers', **params):
+        from django.test.client import RequestFactory
+        return self.resource(RequestFactory().get(url, params), emitter_format='json')
+
+    def follow(self, url):
+        import urlparse
+        parts = urlparse.urlparse(url)
+        return self.get(parts.path, **dict(urlparse.parse_qsl(parts.query)))
+
+    def ids(self, resp):
+        return [ item['id'] for item in simplejson.loads(resp.content)['items'] ]
+
+    def test_pages(self):
+        expected = [ c.pk for c in Consumer.objects.order_by('-name', '-id') ]
+
+        first = simplejson.loads(self.get().content)
+        self.assertEquals(expected[:3], [ item['id'] for item in first['items'] ])
+        self.assertEquals(None, first['prev'])
+        self.assertTrue(first['next'].startswith('http://testserver/consumers?cursor='))
+
+        second = simplejson.loads(self.follow(first['next']).content)
+        self.assertEquals(expected[3:6], [ item['id'] for item in second['items'] ])
+
+        third = simplejson.loads(self.follow(second['next']).content)
+        self.assertEquals(expected[6:], [ item['id'] for item in third['items'] ])
+        self.assertEquals(None, third['next'])
+
+        # ... and back.
+        self.assertEquals(expected[3:6], self.ids(self.follow(third['prev'])))
+        back = simplejson.loads(self.follow(second['prev']).content)
+        self.assertEquals(expected[:3], [ item['id'] for item in back['items'] ])
+        self.assertEquals(None, back['prev'])
+
+    def test_limit_and_header_links(self):
+        self.assertEquals(4, len(self.ids(self.get(limit=10))))
+        self.assertEquals(1, len(self.ids(self.get(limit=1))))
+
+        self.handler.max_page_size = None
+        self.assertEquals(7, len(self.ids(self.get(limit=10))))
+        self.handler.max_page_size = 4
+
+        self.handler.page_links = 'header'
+        resp = self.get(limit=2)
+
+        self.assertEquals(2, len(simplejson.loads(resp.content)))
+        self.assertTrue(resp['Link'].endswith('limit=2>; rel="next"'))
+
+    def test_repeated_parameters(self):
+        import urlparse
+        from django.test.client import RequestFactory
+
+        request = RequestFactory().get('/consumers?tag=a&tag=b&limit=2')
+        first = simplejson.loads(self.resource(request, emitter_format='json').content)
+        query = urlparse.parse_qs(urlparse.urlparse(first['next']).query)
+
+        self.assertEquals([ 'a', 'b' ], query['tag'])
+        self.assertEquals([ '2' ], query['limit'])
+
+    def test_counts(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.handler.page_count = 'exact'
+        first = self.get()
+        self.assertEquals('7', first['X-Total-Count'])
+        self.assertEquals(7, simplejson.loads(first.content)['total'])
+
+        # Counted once per filter, the queries are those of the
+        # page: its keys, then its rows.
+        self.assertNumQueries(2, lambda: self.follow(simplejson.loads(first.content)['next']))
+
+        # ... until the model changes.
+        Consumer(name='c9', description='', status='accepted').save()
+        self.assertEquals('8', self.get()['X-Total-Count'])
+
+        # No estimates from SQLite, so those are exact as well.
+        self.handler.page_count = 'estimate'
+        resp = self.get()
+        self.assertEquals('8', resp['X-Total-Count'])
+        self.assertFalse(resp.has_header('X-Total-Count-Estimated'))
+
+        self.handler.page_count = staticmethod(lambda queryset: 1000)
+        self.assertEquals('1000', self.get()['X-Total-Count'])
+
+        self.handler.page_count = None
+        self.assertFalse(self.get().has_header('X-Total-Count'))
+        self.assertFalse('total' in simplejson.loads(self.get().content))
+
+    def test_emitted_like_querysets(self):
+        user = User.objects.create_user('paged', 'paged@example.com', 'x')
+        Consumer.objects.update(user=user)
+
+        self.handler.fields = ('id', 'name', ('user', ('id', 'username')))
+
+        # Relations are fetched along with the page.
+        resp = [ ]
+        self.assertNumQueries(2, lambda: resp.append(self.get(limit=4)))
+        items = simplejson.loads(resp[0].content)['items']
+        self.assertEquals(4, len(items))
+        self.assertEquals([ { 'id': user.pk, 'username': 'paged' } ] * 4,
+                          [ item['user'] for item in items ])
+
+        self.handler.page_links = 'header'
+        self.assertNumQueries(2, lambda: self.get(limit=4))
+
+    def test_list_fields(self):
+        self.handler.list_fields = ('name',)
+
+        for links in ('payload', 'header'):
+            self.handler.page_links = links
+            data = simplejson.loads(self.get().content)
+            items = links == 'payload' and data['items'] or data
+
+            self.assertEquals([ [ 'name' ] ] * 3, [ item.keys() for item in items ])
+
+    def test_field_selection(self):
+        self.handler.field_selection = True
+
+        for links in ('payload', 'header'):
+            self.handler.page_links = links
+            data = simplejson.loads(self.get(fields='name').content)
+            items = links == 'payload' and data['items'] or data
+
+            self.assertEquals([ [ 'name' ] ] * 3, [ item.keys() for item in items ])
+
+            resp = self.get(fields='nonexistent')
+            self.assertEquals(400, resp.status_code)
+            self.assertTrue("Unknown field 'nonexistent'." in resp.content)
+
+    def test_bad_parameters(self):
+        resp = self.get(cursor='garbage')
+        self.assertEquals(400, resp.status_code)
+        self.assertTrue('Invalid cursor' in resp.content)
+        self.assertEquals(400, self.get(limit='x').status_code)
+        self.assertEquals(400, self.get(limit='0').status_code)
+
+    def test_bad_ordering(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from pagination import paginate
+
+        # The handler's mistake, not the client's.
+        for ordering in (('user',), ('nonexistent',)):
+            self.assertRaises(ImproperlyConfigured, paginate,
+                HttpRequest(), Consumer.objects.all(), ordering, 3, 4)
+
+class EmittableTest(TestCase):
+    def test_own_fields(self):
+        from emitters import Emitter
+
+        consumer = Consumer(name='c', description='', status='accepted')
+        consumer.save()
+
+        class Wrapper(object):
+            def __emittable__(self):
+                return consumer
+
+        # What `__emittable__` returns is emitted by its own
+        # rules, not through the fields of what holds it.
+        emitter = Emitter.get('json')[0]
+        data = emitter([ Wrapper() ], HandlerRegistry(), None, ('id',), False).construct()
+        self.assertEquals('c', data[0]['name'])
@@ -0,0 +1,125 @@
+"""
+Compiled URL templates for `resource_uri`.
+
+`reverse` looks the view up, walks the candidate patterns
+of the resolver and checks the result against their regex
+every time it's called. The emitters build a URL for every
+object they emit, always with the same view and number of
+arguments, so that work is done once here, and building
+an URL is down to string interpolation.
+
+Anything not covered (namespaced views, keyword arguments)
+is left to `reverse`.
+"""
+import re, weakref
+
+from django.core.urlresolvers import (get_resolver, get_urlconf,
+    get_script_prefix, get_callable)
+from django.utils.encoding import force_unicode, iri_to_uri
+
+# What `iri_to_uri` leaves alone.
+_unsafe = re.compile(ur"[^A-Za-z0-9_.\-/#%\[\]=:;$&()+,!?*@'~]")
+
+class URLTemplate(object):
+    """
+    The ways of reversing a view with `nargs` positional
+    arguments, in the order `reverse` tries them.
+    """
+    def __init__(self, candidates):
+        self.candidates = candidates
+
+    def expand(self, args):
+        """
+        Returns the URL (without script prefix) for `args`,
+        or None if none of the candidates match them.
+        """
+        args = [ force_unicode(arg) for arg in args ]
+
+        for result, params, regex in self.candidates:
+            candidate = result % dict(zip(params, args))
+
+            if regex.search(candidate):
+                return candidate
+
+def compile_template(resolver, url_id, nargs):
+    """
+    Returns a `URLTemplate` for reversing `url_id` with
+    `nargs` arguments through `resolver`, or None if it's
+    something only `reverse` knows how to deal with.
+    """
+    if isinstance(url_id, basestring) and ':' in url_id:
+        return None
+
+    try:
+        view = get_callable(url_id, True)
+    except (ImportError, AttributeError):
+        return None
+
+    candidates = [ ]
+
+    # Entries are (possibility, pattern) up to Django 1.3, with
+    # the defaults added after that. Anything else is unknown
+    # territory, better left to `reverse`.
+    for entry in resolver.reverse_dict.getlist(view):
+        if not isinstance(entry, tuple) or len(entry) < 2:
+            return None
+
+        possibility, pattern = entry[0], entry[1]
+        regex = re.compile(u'^%s' % pattern, re.UNICODE)
+
+        for bits in possibility:
+            if not isinstance(bits, tuple) or len(bits) < 2:
+                return None
+
+            result, params = bits[0], bits[1]
+
+            if len(params) == nargs:
+                candidates.append((result, params, regex))
+
+    if not candidates:
+        return None
+
+    return URLTemplate(candidates)
+
+# Resolver -> { (url_id, nargs): URLTemplate or None }. Keyed
+# on the resolver so `clear_url_caches` clears these as well.
+_templates = weakref.WeakKeyDictionary()
+
+def expand(url_id, args):
+    """
+    Returns what `reverse(url_id, args=args)` would, or None
+    if it has to be left to `reverse` (including when no
+    pattern matches, so it raises `NoReverseMatch` for us.)
+    """
+    if not isinstance(args, (list, tuple)):
+        return None
+
+    resolver = get_resolver(get_urlconf())
+    templates = _templates.get(resolver)
+
+    if templates is None:
+        templates = _templates[resolver] = { }
+
+    key = (url_id, len(args))
+
+    try:
+        template = templates[key]
+    except KeyError:
+        template = templates[key] = compile_template(resolver, url_id, len(args))
+    except TypeError:
+        return None
+
+    if template is None:
+        return None
+
+    path = template.expand(args)
+
+    if path is None:
+        return None
+
+    url = u'%s%s' % (get_script_prefix(), path)
+
+    if _unsafe.search(url):
+        return iri_to_uri(url)
+
+    return str(url)
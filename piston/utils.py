@@ -1,7 +1,8 @@
-import time
+import time, StringIO
 from django.http import HttpResponseNotAllowed, HttpResponseForbidden, HttpResponse, HttpResponseBadRequest
 from django.core.urlresolvers import reverse
 from django.core.cache import cache
+from django.core.handlers.wsgi import LimitedStream
 from django import get_version as django_version
 from django.core.mail import send_mail, mail_admins
 from django.conf import settings
@@ -198,6 +199,7 @@ class MimerDataException(Exception):
 
 class Mimer(object):
     TYPES = dict()
+    STREAMING = set()
     
     def __init__(self, request):
         self.request = request
@@ -220,6 +222,35 @@ class Mimer(object):
                 if ctype.startswith(mime):
                     return loadee
                     
+    def is_streaming(self):
+        """
+        Whether the request body is for a streaming loader,
+        in which case nothing should read it up front.
+        """
+        ctype = self.content_type()
+
+        if ctype is None or self.is_multipart():
+            return False
+
+        return self.loader_for_type(ctype) in Mimer.STREAMING
+
+    def body(self):
+        """
+        The request body, as a file-like object read as
+        it's consumed (unless Django already read it.)
+        """
+        if not hasattr(self.request, '_stream'):
+            return StringIO.StringIO(self.request.raw_post_data)
+
+        try:
+            length = int(self.request.META.get('CONTENT_LENGTH', 0))
+        except (ValueError, TypeError):
+            length = 0
+
+        # Never reads past Content-Length, and `readline` only
+        # buffers `buf_size` bytes at a time.
+        return LimitedStream(self.request, length, buf_size=8192)
+
     def content_type(self):
         """
         Returns the content type of the request in all cases where it is
@@ -253,7 +284,10 @@ class Mimer(object):
         if not self.is_multipart() and ctype:
             loadee = self.loader_for_type(ctype)
             
-            if loadee:
+            if loadee in Mimer.STREAMING:
+                self.request.data = loadee(self.body())
+                self.request.POST = self.request.PUT = dict()
+            elif loadee:
                 try:
                     self.request.data = loadee(self.request.raw_post_data)
                         
@@ -269,11 +303,24 @@ class Mimer(object):
         return self.request
                 
     @classmethod
-    def register(cls, loadee, types):
+    def register(cls, loadee, types, streaming=False):
+        """
+        Register `loadee` as the loader for the content types
+        in `types`. Streaming loaders get the request body as
+        a file-like object instead of a string, and can hand
+        their results out as they go: `request.data` is
+        whatever they return, and the request isn't read
+        until the handler goes through it. They should raise
+        `MimerDataException` on bad data.
+        """
         cls.TYPES[loadee] = types
+
+        if streaming:
+            cls.STREAMING.add(loadee)
         
     @classmethod
     def unregister(cls, loadee):
+        cls.STREAMING.discard(loadee)
         return cls.TYPES.pop(loadee)
 
 def translate_mime(request):
@@ -0,0 +1,19 @@
+from piston.handler import BaseHandler
+
+from models import FlatRow, Post, Event
+
+class FlatRowHandler(BaseHandler):
+    model = FlatRow
+    fields = ('id', 'n', 'x', 'y', 'label', 'flag')
+
+    @classmethod
+    def shout(cls, row):
+        return row.label.upper()
+
+class PostHandler(BaseHandler):
+    model = Post
+    fields = ('id', 'title', 'author', 'editor', 'category')
+
+class EventHandler(BaseHandler):
+    model = Event
+    fields = ('id', 'name', 'day', 'starts', 'ends', 'created', 'updated')
@@ -0,0 +1,61 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from test_project.apps.benchmarks import suite
+
+def split(value):
+    return [ part.strip() for part in value.split(',') if part.strip() ]
+
+class Command(BaseCommand):
+    help = "Benchmarks the emitters over synthetic model graphs, in a " \
+           "throwaway test database."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--scenarios', default='',
+            help="Comma separated scenarios (%s). All by default." % ', '.join(sorted(suite.SCENARIOS))),
+        make_option('--sizes', default='100,1000',
+            help="Comma separated numbers of rows. Default: 100,1000."),
+        make_option('--emitters', default='',
+            help="Comma separated emitter names. All registered ones by default."),
+        make_option('--json-backends', default='auto',
+            help="Comma separated JSON backends to run the JSON emitter with. Default: auto."),
+        make_option('--repeat', default=3, type='int',
+            help="Runs per result, the best one is kept. Default: 3."),
+        make_option('--output', default=None,
+            help="Write the results to this file, as JSON."),
+        make_option('--baseline', default=None,
+            help="Compare the results to those in this file (from --output.)"),
+    )
+
+    def handle(self, *args, **options):
+        scenarios = split(options['scenarios'])
+
+        for scenario in scenarios:
+            if scenario not in suite.SCENARIOS:
+                raise CommandError("Unknown scenario %s" % scenario)
+
+        try:
+            sizes = [ int(size) for size in split(options['sizes']) ]
+        except ValueError:
+            raise CommandError("Invalid sizes %s" % options['sizes'])
+
+        baseline = options['baseline'] and suite.read(options['baseline'])
+        old_name = connection.creation.create_test_db(verbosity=0)
+
+        try:
+            results = suite.run(scenarios, sizes, split(options['emitters']),
+                                split(options['json_backends']), options['repeat'],
+                                log=lambda line: self.stdout.write(line + '\n'))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            suite.write(results, options['output'])
+
+        if baseline:
+            self.stdout.write('\nRender throughput against %s:\n' % options['baseline'])
+
+            for line in suite.compare(results, baseline):
+                self.stdout.write(line + '\n')
@@ -0,0 +1,36 @@
+from django.db import models
+
+class FlatRow(models.Model):
+    n = models.IntegerField()
+    x = models.FloatField()
+    y = models.FloatField()
+    label = models.CharField(max_length=32)
+    flag = models.BooleanField(default=False)
+
+    def ratio(self):
+        return self.x / (self.y or 1)
+
+class Author(models.Model):
+    name = models.CharField(max_length=64)
+
+class Category(models.Model):
+    name = models.CharField(max_length=64)
+
+class Tag(models.Model):
+    name = models.CharField(max_length=32)
+
+class Post(models.Model):
+    title = models.CharField(max_length=128)
+    body = models.TextField()
+    author = models.ForeignKey(Author, related_name='posts')
+    editor = models.ForeignKey(Author, related_name='edited')
+    category = models.ForeignKey(Category)
+    tags = models.ManyToManyField(Tag)
+
+class Event(models.Model):
+    name = models.CharField(max_length=64)
+    day = models.DateField()
+    starts = models.DateTimeField()
+    ends = models.DateTimeField()
+    created = models.DateTimeField()
+    updated = models.DateTimeField()
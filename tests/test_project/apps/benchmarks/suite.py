@@ -0,0 +1,298 @@
+"""
+Throughput benchmarks for `Emitter.construct` and `render`.
+
+Every scenario fills the database with a synthetic model
+graph of the requested size, and every registered emitter
+(or the ones asked for) emits it. For each combination we
+keep the best of `repeat` runs of:
+
+ - `construct`: building the data structure, including
+   fetching the rows, like a handler returning a QuerySet.
+ - `render`: construct and encode, all of it.
+
+and report rows/s for both, bytes/s of the rendered output
+and the peak memory a run took over what the process used
+before (when runs can be forked off, see `isolated`.)
+
+The JSON emitter runs once for each JSON backend asked for
+(see `piston.json_backends`), so they can be compared.
+"""
+import os, sys, time, datetime, random, platform
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpRequest
+from django.utils import simplejson
+from django.utils.encoding import smart_str
+
+import django
+from piston.emitters import Emitter
+from piston.handler import typemapper
+from piston import json_backends
+
+from models import FlatRow, Author, Category, Tag, Post, Event
+from handlers import FlatRowHandler, PostHandler, EventHandler
+
+def make_flat(n, rnd):
+    for i in xrange(n):
+        FlatRow(n=i, x=rnd.random() * 1000, y=rnd.random(),
+                label='row %d' % i, flag=bool(i % 2)).save()
+
+def make_posts(n, rnd):
+    authors = [ Author.objects.create(name='author %d' % i) for i in xrange(max(1, n / 10)) ]
+    categories = [ Category.objects.create(name='category %d' % i) for i in xrange(10) ]
+    tags = [ Tag.objects.create(name='tag %d' % i) for i in xrange(20) ]
+
+    for i in xrange(n):
+        post = Post.objects.create(title='post %d' % i, body='lorem ipsum ' * 20,
+                                   author=rnd.choice(authors), editor=rnd.choice(authors),
+                                   category=rnd.choice(categories))
+        post.tags = rnd.sample(tags, 5)
+
+def make_events(n, rnd):
+    start = datetime.datetime(2010, 1, 1)
+
+    for i in xrange(n):
+        starts = start + datetime.timedelta(minutes=rnd.randint(0, 10 ** 6))
+        ends = starts + datetime.timedelta(minutes=rnd.randint(1, 600))
+
+        Event(name='event %d' % i, day=starts.date(), starts=starts, ends=ends,
+              created=starts - datetime.timedelta(days=30), updated=ends).save()
+
+# Name -> (generator, model, handler, fields)
+SCENARIOS = {
+    'flat': (make_flat, FlatRow, FlatRowHandler, ()),
+    'methods': (make_flat, FlatRow, FlatRowHandler, ('id', 'label', 'ratio', 'shout')),
+    'fk': (make_posts, Post, PostHandler,
+           ('id', 'title', ('author', ('id', 'name')), ('editor', ('id', 'name')),
+            ('category', ('id', 'name')))),
+    'm2m': (make_posts, Post, PostHandler, ('id', 'title', ('tags', ('id', 'name')))),
+    'datetime': (make_events, Event, EventHandler, ()),
+}
+
+MODELS = (FlatRow, Post, Tag, Author, Category, Event)
+
+def populate(scenario, size, seed=0):
+    """
+    Replaces whatever is in the benchmark tables with
+    `size` rows for `scenario`.
+    """
+    generate = SCENARIOS[scenario][0]
+
+    transaction.enter_transaction_management()
+    transaction.managed(True)
+    try:
+        for model in MODELS:
+            model.objects.all().delete()
+
+        generate(size, random.Random(seed))
+        transaction.commit()
+    finally:
+        transaction.leave_transaction_management()
+
+def peak_memory():
+    """
+    The peak resident size of this process, in bytes,
+    or `None` where that isn't known.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes everywhere but on OS X.
+    if sys.platform != 'darwin':
+        maxrss *= 1024
+
+    return maxrss
+
+def current_memory():
+    try:
+        resident = int(open('/proc/self/statm').read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+
+    return resident * os.sysconf('SC_PAGE_SIZE')
+
+def isolated(func):
+    """
+    Runs `func` in a child process (where there's `fork`)
+    so its peak memory can be told apart from that of the
+    runs before it. Returns what `func` returns (which has
+    to be JSON serializable) with `peak_memory` added.
+    """
+    if not hasattr(os, 'fork'):
+        result = func()
+        result['peak_memory'] = None
+        return result
+
+    read, write = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read)
+        status = 0
+
+        try:
+            try:
+                before = current_memory()
+                result = func()
+                after = peak_memory()
+
+                if before is None or after is None:
+                    result['peak_memory'] = None
+                else:
+                    result['peak_memory'] = max(0, after - before)
+            except Exception, e:
+                result, status = { 'error': '%s: %s' % (type(e).__name__, e) }, 1
+
+            os.write(write, simplejson.dumps(result))
+        finally:
+            os._exit(status)
+
+    os.close(write)
+    chunks = [ ]
+
+    while True:
+        chunk = os.read(read, 65536)
+
+        if not chunk:
+            break
+
+        chunks.append(chunk)
+
+    os.close(read)
+    os.waitpid(pid, 0)
+
+    return simplejson.loads(''.join(chunks))
+
+def measure(emitter, scenario, size, repeat):
+    """
+    Best-of-`repeat` timings of `emitter` over the rows
+    of `scenario` currently in the database.
+    """
+    model, handler, fields = SCENARIOS[scenario][1:]
+    request = HttpRequest()
+    construct = render = None
+
+    # Plans, compiled queries etc. are set up on the first run.
+    emitter(model.objects.all(), typemapper, handler(), fields, False).render(request)
+
+    for i in xrange(repeat):
+        srl = emitter(model.objects.all(), typemapper, handler(), fields, False)
+        start = time.time()
+        srl.construct(request=request)
+        elapsed = time.time() - start
+        construct = min(construct or elapsed, elapsed)
+
+        srl = emitter(model.objects.all(), typemapper, handler(), fields, False)
+        start = time.time()
+        length = len(smart_str(srl.render(request)))
+        elapsed = time.time() - start
+        render = min(render or elapsed, elapsed)
+
+    return { 'construct_seconds': construct, 'render_seconds': render, 'bytes': length,
+             'construct_rows_per_second': size / max(construct, 1e-9),
+             'render_rows_per_second': size / max(render, 1e-9),
+             'bytes_per_second': length / max(render, 1e-9) }
+
+def run(scenarios=None, sizes=(100, 1000), emitters=None, json_backend_names=('auto',),
+        repeat=3, log=None):
+    """
+    Runs the benchmarks, returning the results as a dict
+    (see `write`.) `log` gets a line for every result.
+    """
+    scenarios = scenarios or sorted(SCENARIOS)
+    emitters = emitters or sorted(Emitter.EMITTERS)
+    results = [ ]
+
+    for scenario in scenarios:
+        for size in sizes:
+            populate(scenario, size)
+
+            for name in emitters:
+                klass = Emitter.get(name)[0]
+                backends = [ None ]
+
+                if name == 'json':
+                    backends = json_backend_names
+
+                for backend in backends:
+                    def bench():
+                        if backend is not None:
+                            settings.PISTON_JSON_BACKEND = backend
+                            json_backends.get_backend()
+
+                        return measure(klass, scenario, size, repeat)
+
+                    result = isolated(bench)
+                    result.update({ 'scenario': scenario, 'size': size, 'emitter': name,
+                                    'json_backend': backend })
+                    results.append(result)
+
+                    if log is not None:
+                        log(format_result(result))
+
+    return { 'meta': metadata(sizes, repeat), 'results': results }
+
+def metadata(sizes, repeat):
+    return { 'date': datetime.datetime.utcnow().isoformat(),
+             'python': platform.python_version(),
+             'django': django.get_version(),
+             'platform': platform.platform(),
+             'sizes': list(sizes), 'repeat': repeat }
+
+def label(result):
+    name = result['emitter']
+
+    if result.get('json_backend'):
+        name = '%s[%s]' % (name, result['json_backend'])
+
+    return '%s/%s/%s' % (result['scenario'], result['size'], name)
+
+def format_result(result):
+    if 'error' in result:
+        return '%-36s %s' % (label(result), result['error'])
+
+    memory = result.get('peak_memory')
+    memory = memory is not None and '%.1f MB' % (memory / 1048576.0) or '-'
+
+    return '%-36s construct %10.0f rows/s  render %10.0f rows/s %8.2f MB/s  peak %s' % (
+        label(result), result['construct_rows_per_second'],
+        result['render_rows_per_second'], result['bytes_per_second'] / 1048576.0, memory)
+
+def compare(results, baseline):
+    """
+    Lines comparing the render throughput of `results` to
+    the matching results in `baseline` (both as returned
+    by `run`.)
+    """
+    before = dict([ (label(r), r) for r in baseline['results'] if 'error' not in r ])
+    lines = [ ]
+
+    for result in results['results']:
+        old = before.get(label(result))
+
+        if old is None or 'error' in result:
+            continue
+
+        lines.append('%-36s %6.2fx' % (label(result), result['render_rows_per_second'] /
+                                       max(old['render_rows_per_second'], 1e-9)))
+
+    return lines
+
+def write(results, path):
+    f = open(path, 'w')
+    try:
+        simplejson.dump(results, f, indent=2, sort_keys=True)
+    finally:
+        f.close()
+
+def read(path):
+    f = open(path)
+    try:
+        return simplejson.load(f)
+    finally:
+        f.close()
@@ -0,0 +1,19 @@
+from django.test import TestCase
+
+from test_project.apps.benchmarks import suite as benchmarks
+
+class SuiteTest(TestCase):
+    def test_run(self):
+        results = benchmarks.run([ 'flat', 'fk' ], [ 5 ], [ 'json', 'xml' ], [ 'json', 'django' ], repeat=1)
+        labels = [ benchmarks.label(result) for result in results['results'] ]
+
+        self.assertEquals([ 'flat/5/json[json]', 'flat/5/json[django]', 'flat/5/xml',
+                            'fk/5/json[json]', 'fk/5/json[django]', 'fk/5/xml' ], labels)
+
+        for result in results['results']:
+            self.assertFalse('error' in result, result.get('error'))
+            self.assertTrue(result['bytes'] > 0)
+            self.assertTrue(result['render_rows_per_second'] > 0)
+
+        self.assertEquals([ 5 ], results['meta']['sizes'])
+        self.assertEquals(6, len(benchmarks.compare(results, results)))
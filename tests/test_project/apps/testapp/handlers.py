@@ -27,6 +27,7 @@ class EntryHandler(BaseHandler):
 class ExpressiveHandler(BaseHandler):
     model = ExpressiveTestModel
     fields = ('title', 'content', ('comments', ('content',)))
+    auto_only = True
 
     @classmethod
     def comments(cls, em):
@@ -80,6 +81,7 @@ class ListFieldsHandler(BaseHandler):
     model = ListFieldsModel
     fields = ('id','kind','variety','color')
     list_fields = ('id','variety')
+    field_selection = True
 
 class Issue58Handler(BaseHandler):
     model = Issue58Model
@@ -171,28 +171,14 @@ class AbstractBaseClassTests(MainTests):
         result = self.client.get('/api/abstract.json',
                 HTTP_AUTHORIZATION=self.auth_string).content
                 
-        expected = """[
-    {
-        "id": 1, 
-        "some_other": "something else", 
-        "some_field": "something here"
-    }, 
-    {
-        "id": 2, 
-        "some_other": "something else", 
-        "some_field": "something here"
-    }
-]"""
+        expected = ('[{"id":1,"some_other":"something else","some_field":"something here"},'
+                    '{"id":2,"some_other":"something else","some_field":"something here"}]')
         
         self.assertEquals(result, expected)
 
     def test_specific_id(self):
         ids = (1, 2)
-        be = """{
-    "id": %d, 
-    "some_other": "something else", 
-    "some_field": "something here"
-}"""
+        be = '{"id":%d,"some_other":"something else","some_field":"something here"}'
         
         for id_ in ids:
             result = self.client.get('/api/abstract/%d.json' % id_,
@@ -227,7 +213,7 @@ class IncomingExpressiveTests(MainTests):
     }
 ]"""
     
-        result = self.client.get('/api/expressive.json',
+        result = self.client.get('/api/expressive.json', { 'pretty': 1 },
             HTTP_AUTHORIZATION=self.auth_string).content
 
         self.assertEquals(result, expected)
@@ -262,7 +248,7 @@ class IncomingExpressiveTests(MainTests):
     }
 ]"""
         
-        result = self.client.get('/api/expressive.json', 
+        result = self.client.get('/api/expressive.json', { 'pretty': 1 },
             HTTP_AUTHORIZATION=self.auth_string).content
             
         self.assertEquals(result, expected)
@@ -399,7 +385,7 @@ class ListFieldsTest(MainTests):
     "id": 1, 
     "variety": "apple"
 }'''
-        resp = self.client.get('/api/list_fields/1')
+        resp = self.client.get('/api/list_fields/1', { 'pretty': 1 })
         self.assertEquals(resp.status_code, 200)
         self.assertEquals(resp.content, expect)
 
@@ -419,10 +405,109 @@ class ListFieldsTest(MainTests):
         "variety": "dog"
     }
 ]'''
-        resp = self.client.get('/api/list_fields')
+        resp = self.client.get('/api/list_fields', { 'pretty': 1 })
         self.assertEquals(resp.status_code, 200)
         self.assertEquals(resp.content, expect)
-        
+
+    def test_field_selection(self):
+        resp = self.client.get('/api/list_fields', { 'fields': 'variety' })
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals('[{"variety":"apple"},{"variety":"carrot"},{"variety":"dog"}]', resp.content)
+
+        resp = self.client.get('/api/list_fields/1', { 'fields': 'color,kind' })
+        self.assertEquals({ 'color': 'green', 'kind': 'fruit' }, simplejson.loads(resp.content))
+
+        # Collections only have `list_fields`.
+        resp = self.client.get('/api/list_fields', { 'fields': 'variety,color' })
+        self.assertEquals(resp.status_code, 400)
+        self.assertEquals("Unknown field 'color'.", resp.content)
+
+    def test_field_selection_plans(self):
+        from piston.emitters import FieldPlan
+
+        self.client.get('/api/list_fields/1', { 'fields': 'color,kind' })
+        count = len(FieldPlan.PLANS)
+
+        # Permutations are the same selection.
+        resp = self.client.get('/api/list_fields/1', { 'fields': 'kind,color,kind' })
+        self.assertEquals({ 'color': 'green', 'kind': 'fruit' }, simplejson.loads(resp.content))
+        self.assertEquals(count, len(FieldPlan.PLANS))
+
+        settings.PISTON_PLAN_CACHE_SIZE = 2
+        try:
+            for selection in ('color', 'kind', 'variety', 'color,variety'):
+                self.client.get('/api/list_fields/1', { 'fields': selection })
+                self.assertTrue(len(FieldPlan.PLANS) <= 2)
+        finally:
+            del settings.PISTON_PLAN_CACHE_SIZE
+
+class ColumnPruningTests(MainTests):
+    def init_delegate(self):
+        em = ExpressiveTestModel(title='foo', content='bar', never_shown='x' * 1000)
+        em.save()
+        Comment(parent=em, content='baz').save()
+
+    def select(self, url, **kwargs):
+        from django.db import connection
+
+        connection.use_debug_cursor = True
+        connection.queries = [ ]
+        try:
+            resp = self.client.get(url, HTTP_AUTHORIZATION=self.auth_string, **kwargs)
+            return resp, [ q['sql'] for q in connection.queries ]
+        finally:
+            connection.use_debug_cursor = None
+
+    def test_unused_columns(self):
+        resp, queries = self.select('/api/expressive.json')
+
+        self.assertEquals([ { 'title': 'foo', 'content': 'bar', 'comments': [ { 'content': 'baz' } ] } ],
+                          simplejson.loads(resp.content))
+
+        emitted = [ q for q in queries if 'FROM "testapp_expressivetestmodel"' in q ]
+        self.assertEquals(1, len(emitted))
+        self.assertTrue('"title"' in emitted[0])
+        self.assertFalse('never_shown' in emitted[0])
+
+    def test_disabled(self):
+        setattr(settings, 'PISTON_PRUNE_COLUMNS', False)
+        try:
+            resp, queries = self.select('/api/expressive.json')
+        finally:
+            del settings.PISTON_PRUNE_COLUMNS
+
+        self.assertTrue([ q for q in queries if 'never_shown' in q ])
+
+    def test_opt_in(self):
+        from test_project.apps.testapp.handlers import ExpressiveHandler
+
+        ExpressiveHandler.auto_only = False
+        try:
+            resp, queries = self.select('/api/expressive.json')
+        finally:
+            ExpressiveHandler.auto_only = True
+
+        self.assertTrue([ q for q in queries if 'never_shown' in q ])
+
+    def test_handler_method_fallback(self):
+        from piston.emitters import Emitter
+        from piston.handler import HandlerRegistry
+
+        class Handler(object):
+            @staticmethod
+            def parent_id(comment):
+                return comment.content
+
+        fields = ('content', 'parent_id')
+        emitter, ct = Emitter.get('json')
+
+        srl = emitter(Comment.objects.all(), HandlerRegistry(), None, fields, False)
+        self.assertEquals([ 'id', 'content', 'parent' ], srl.required_columns(Comment, fields))
+
+        # `parent_id` may be `None` and go to the handler.
+        srl = emitter(Comment.objects.all(), HandlerRegistry(), Handler(), fields, False)
+        self.assertEquals(None, srl.required_columns(Comment, fields))
+
 class ErrorHandlingTests(MainTests):
     """Test proper handling of errors by Resource"""
 
@@ -453,16 +538,7 @@ class Issue58ModelTests(MainTests):
     def test_incoming_json(self):
         outgoing = simplejson.dumps({ 'read': True, 'model': 'T'})
 
-        expected = """[
-    {
-        "read": true, 
-        "model": "t"
-    }, 
-    {
-        "read": false, 
-        "model": "f"
-    }
-]"""
+        expected = '[{"read":true,"model":"t"},{"read":false,"model":"f"}]'
 
         # test GET
         result = self.client.get('/api/issue58.json',
@@ -473,3 +549,431 @@ class Issue58ModelTests(MainTests):
         resp = self.client.post('/api/issue58.json', outgoing, content_type='application/json',
                                 HTTP_AUTHORIZATION=self.auth_string)
         self.assertEquals(resp.status_code, 201)
+
+class FieldPlanTests(MainTests):
+    def init_delegate(self):
+        ListFieldsModel(kind='fruit', variety='apple', color='green').save()
+        ListFieldsModel(kind='vegetable', variety='carrot', color='orange').save()
+
+    def test_plan_is_cached(self):
+        from piston.emitters import Emitter, FieldPlan
+        from piston.handler import typemapper
+        from test_project.apps.testapp.handlers import ListFieldsHandler
+
+        emitter, ct = Emitter.get('json')
+        srl = emitter(ListFieldsModel.objects.all(), typemapper,
+                      ListFieldsHandler(), ListFieldsHandler.list_fields, False)
+
+        self.assertEquals([ { 'id': 1, 'variety': 'apple' },
+                            { 'id': 2, 'variety': 'carrot' } ], srl.construct())
+
+        plan = srl.get_plan(ListFieldsModel, ('id', 'variety'))
+        self.assertEquals(['variety'], plan.attrs)
+        self.assertEquals([ (FieldPlan.ATTR, 'id', None) ], plan.rest)
+        self.assertTrue(plan is srl.get_plan(ListFieldsModel, ('id', 'variety')))
+        self.assertTrue(plan in FieldPlan.PLANS.values())
+
+class RelatedLookupsTests(MainTests):
+    def init_delegate(self):
+        for title in ('foo', 'bar'):
+            em = ExpressiveTestModel(title=title, content='content')
+            em.save()
+            Comment(parent=em, content='comment on %s' % title).save()
+
+    def test_foreign_keys_are_selected(self):
+        from piston.emitters import Emitter
+        from piston.handler import typemapper, BaseHandler
+
+        fields = ('content', ('parent', ('title',)))
+        emitter, ct = Emitter.get('json')
+        srl = emitter(Comment.objects.all(), typemapper, BaseHandler(), fields, False)
+
+        self.assertEquals((['parent'], []), srl.related_lookups(Comment, fields))
+
+        expected = [ { 'content': 'comment on foo', 'parent': { 'title': 'foo' } },
+                     { 'content': 'comment on bar', 'parent': { 'title': 'bar' } } ]
+        self.assertNumQueries(1, lambda: self.assertEquals(expected, srl.construct()))
+
+    def test_opt_out(self):
+        from piston.emitters import Emitter
+        from piston.handler import typemapper, BaseHandler
+
+        handler = BaseHandler()
+        handler.auto_related = False
+
+        emitter, ct = Emitter.get('json')
+        srl = emitter(Comment.objects.all(), typemapper, handler,
+                      ('content', ('parent', ('title',))), False)
+
+        self.assertNumQueries(3, srl.construct)
+
+    def test_by_anonymity(self):
+        from piston.emitters import Emitter
+        from piston.handler import HandlerRegistry
+
+        class ParentHandler(object):
+            fields = ('title', ('comments', ('content',)))
+            exclude = ()
+
+        class AnonymousParentHandler(object):
+            fields = ('title',)
+            exclude = ()
+
+        typemapper = HandlerRegistry()
+        typemapper[ParentHandler] = (ExpressiveTestModel, False, False)
+        typemapper[AnonymousParentHandler] = (ExpressiveTestModel, True, False)
+
+        fields = ('content', 'parent')
+        emitter, ct = Emitter.get('json')
+        lookups = lambda anonymous: emitter(Comment.objects.all(), typemapper, None, fields,
+                                            anonymous).related_lookups(Comment, fields)
+
+        self.assertEquals((['parent'], ['parent__comments']), lookups(False))
+        self.assertEquals((['parent'], []), lookups(True))
+
+class ValuesFastPathTests(MainTests):
+    def init_delegate(self):
+        ListFieldsModel(kind='fruit', variety='apple', color='green').save()
+        ListFieldsModel(kind='vegetable', variety='carrot', color='orange').save()
+
+    def construct(self, handler, fast=True):
+        from piston.emitters import Emitter
+        from piston.handler import HandlerRegistry
+
+        typemapper = HandlerRegistry()
+        typemapper[handler] = (ListFieldsModel, False, False)
+
+        emitter, ct = Emitter.get('json')
+        srl = emitter(ListFieldsModel.objects.all(), typemapper, handler(), (), False)
+
+        setattr(settings, 'PISTON_VALUES_FAST_PATH', fast)
+        try:
+            return srl, srl.construct()
+        finally:
+            del settings.PISTON_VALUES_FAST_PATH
+
+    def test_same_output(self):
+        class Handler(object):
+            fields = ('id', 'kind', 'variety')
+            exclude = ()
+
+            @staticmethod
+            def resource_uri(obj):
+                return ('list_fields', [ obj.pk ])
+
+        srl, fast = self.construct(Handler)
+        slow = self.construct(Handler, fast=False)[1]
+
+        self.assertEquals(slow, fast)
+        self.assertEquals('/api/list_fields/1', fast[0]['resource_uri'])
+        self.assertTrue(srl.get_plan(ListFieldsModel).values_ok)
+
+    def test_resource_uri_needs_instance(self):
+        class Handler(object):
+            fields = ('id', 'variety')
+            exclude = ()
+
+            @staticmethod
+            def resource_uri(obj):
+                return ('list_fields', [ obj.color ])
+
+        srl, fast = self.construct(Handler)
+
+        self.assertEquals([ 'apple', 'carrot' ], [ d['variety'] for d in fast ])
+        self.assertFalse(srl.get_plan(ListFieldsModel).values_ok)
+
+    def test_later_row_needs_instance(self):
+        ListFieldsModel(kind='fruit', variety='banana', color='yellow').save()
+
+        class Handler(object):
+            fields = ('id', 'variety')
+            exclude = ()
+
+            @staticmethod
+            def resource_uri(obj):
+                if obj.variety == 'apple':
+                    return ('list_fields', [ obj.pk ])
+                return ('list_fields', [ obj.color ])
+
+        ret = [ ]
+        # The rows, then the instances left in one go.
+        self.assertNumQueries(2, lambda: ret.append(self.construct(Handler)))
+        srl, fast = ret[0]
+
+        self.assertEquals([ 'apple', 'carrot', 'banana' ], [ d['variety'] for d in fast ])
+        self.assertFalse(srl.get_plan(ListFieldsModel).values_ok)
+
+class StreamingXMLTests(MultiXMLTests):
+    def test_multixml_streamed(self):
+        from test_project.apps.testapp.urls import entries
+
+        expected = self.client.get('/api/entries.xml',
+                HTTP_AUTHORIZATION=self.auth_string).content
+
+        setattr(settings, 'PISTON_STREAM_CHUNK_SIZE', 1)
+        entries.stream = True
+        try:
+            response = self.client.get('/api/entries.xml',
+                    HTTP_AUTHORIZATION=self.auth_string)
+        finally:
+            entries.stream = False
+            del settings.PISTON_STREAM_CHUNK_SIZE
+
+        self.assertTrue(response.streaming)
+        self.assertEquals(expected, response.content)
+
+class ChunkedQuerySetTests(MainTests):
+    def init_delegate(self):
+        for n in range(5):
+            ListFieldsModel(kind='fruit', variety='apple %d' % n, color='green').save()
+
+        settings.PISTON_QUERYSET_CHUNK_THRESHOLD = 3
+        settings.PISTON_QUERYSET_CHUNK_SIZE = 2
+
+    def tearDown(self):
+        super(ChunkedQuerySetTests, self).tearDown()
+        del settings.PISTON_QUERYSET_CHUNK_THRESHOLD
+        del settings.PISTON_QUERYSET_CHUNK_SIZE
+
+    def construct(self, qs, fields):
+        from piston.emitters import Emitter
+        from piston.handler import typemapper, BaseHandler
+
+        emitter, ct = Emitter.get('json')
+        return emitter(qs, typemapper, BaseHandler(), fields, False).construct()
+
+    def test_keyset_chunks(self):
+        for fields in (('variety',), ('variety', 'pk')):
+            result = [ ]
+            self.assertNumQueries(3, lambda: result.extend(
+                self.construct(ListFieldsModel.objects.all(), fields)))
+            self.assertEquals([ 'apple %d' % n for n in range(5) ],
+                              [ d['variety'] for d in result ])
+
+    def test_below_threshold(self):
+        self.assertNumQueries(1, lambda: self.construct(
+            ListFieldsModel.objects.all()[:3], ('variety',)))
+
+    def test_other_ordering(self):
+        result = [ ]
+        self.assertNumQueries(1, lambda: result.extend(
+            self.construct(ListFieldsModel.objects.order_by('-variety'), ('variety',))))
+        self.assertEquals('apple 4', result[0]['variety'])
+
+class URITemplateTests(MainTests):
+    def test_same_as_reverse(self):
+        from django.core.urlresolvers import reverse
+        from piston.uritemplates import expand
+
+        for args in ([ 1 ], [ 'a b' ], [ u'\xe6\xf8\xe5' ]):
+            self.assertEquals(reverse('list_fields', args=args),
+                              expand('list_fields', args))
+
+    def test_script_prefix(self):
+        from django.core.urlresolvers import get_script_prefix, set_script_prefix
+        from piston.uritemplates import expand
+
+        prefix = get_script_prefix()
+        set_script_prefix('/mount/')
+        try:
+            self.assertEquals('/mount/api/list_fields/1', expand('list_fields', [ 1 ]))
+        finally:
+            set_script_prefix(prefix)
+
+    def test_left_to_reverse(self):
+        from piston.uritemplates import expand
+
+        self.assertEquals(None, expand('list_fields', { 'id': 1 }))
+        self.assertEquals(None, expand('list_fields', [ 1, 2 ]))
+        self.assertEquals(None, expand('testapp:list_fields', [ 1 ]))
+        self.assertEquals(None, expand('no_such_view', [ 1 ]))
+
+    def test_resolver_entries(self):
+        from django.core.urlresolvers import get_resolver
+        from django.utils.datastructures import MultiValueDict
+        from piston.uritemplates import compile_template
+
+        class Resolver(object):
+            def __init__(self, entries):
+                self.reverse_dict = MultiValueDict({ 'list_fields': entries })
+
+        entries = get_resolver(None).reverse_dict.getlist('list_fields')
+
+        # Django 1.4 and later add the defaults.
+        later = Resolver([ tuple(entry[:2]) + ({ },) for entry in entries ])
+        template = compile_template(later, 'list_fields', 1)
+        self.assertEquals('api/list_fields/1', template.expand([ 1 ]))
+
+        for entry in entries:
+            self.assertEquals(template.candidates,
+                              compile_template(Resolver([ entry ]), 'list_fields', 1).candidates)
+
+        self.assertEquals(None, compile_template(Resolver([ 'garbage' ]), 'list_fields', 1))
+        self.assertEquals(None, compile_template(Resolver([ ([ 'x' ], 'p') ]), 'list_fields', 1))
+
+class FragmentCacheTests(MainTests):
+    def init_delegate(self):
+        from django.core.cache import cache
+
+        for variety in ('apple', 'carrot', 'dog'):
+            ListFieldsModel(kind='thing', variety=variety, color='green').save()
+
+        cache.clear()
+
+        class Handler(object):
+            fields = ('id', 'variety', 'shout')
+            exclude = ()
+            fragment_cache = True
+            calls = [ ]
+
+            @staticmethod
+            def shout(obj):
+                Handler.calls.append(obj.pk)
+                return obj.variety.upper()
+
+        self.handler = Handler
+
+    def construct(self, data):
+        from piston.emitters import Emitter
+        from piston.handler import HandlerRegistry
+
+        typemapper = HandlerRegistry()
+        typemapper[self.handler] = (ListFieldsModel, False, False)
+
+        emitter, ct = Emitter.get('json')
+        return emitter(data, typemapper, self.handler(), (), False).construct()
+
+    def test_fragments_are_reused(self):
+        from django.core.cache import cache
+        from piston.caching import fragment_key
+
+        expected = self.construct(ListFieldsModel.objects.all())
+        self.assertEquals([ 1, 2, 3 ], self.handler.calls)
+        self.assertEquals('CARROT', expected[1]['shout'])
+
+        self.assertEquals(expected, self.construct(ListFieldsModel.objects.all()))
+        self.assertEquals(expected, self.construct(list(ListFieldsModel.objects.all())))
+        self.assertEquals(expected[0], self.construct(ListFieldsModel.objects.get(pk=1)))
+        self.assertEquals([ 1, 2, 3 ], self.handler.calls)
+
+        obj = ListFieldsModel.objects.get(pk=2)
+        obj.variety = 'cucumber'
+        obj.save()
+
+        self.assertEquals('CUCUMBER', self.construct(ListFieldsModel.objects.all())[1]['shout'])
+        self.assertEquals([ 1, 2, 3, 2 ], self.handler.calls)
+
+        obj.delete()
+        self.assertEquals(None, cache.get(fragment_key(ListFieldsModel, 2)))
+        self.assertTrue(cache.get(fragment_key(ListFieldsModel, 1)))
+
+class CSVEmitterTests(MainTests):
+    def init_delegate(self):
+        ListFieldsModel(kind='fruit', variety='apple', color='green').save()
+        ListFieldsModel(kind='vegetable', variety=u'\xe6ble, "red"', color='red').save()
+
+        em = ExpressiveTestModel(title='foo', content='bar')
+        em.save()
+        Comment(parent=em, content='baz').save()
+
+    def test_columns_follow_fields(self):
+        resp = self.client.get('/api/list_fields', { 'format': 'csv' })
+
+        self.assertEquals('text/csv; charset=utf-8', resp['Content-Type'])
+        self.assertEquals('id,variety\r\n1,apple\r\n2,"\xc3\xa6ble, ""red"""\r\n', resp.content)
+
+        resp = self.client.get('/api/list_fields/1', { 'format': 'tsv' })
+        self.assertEquals('id\tkind\tvariety\tcolor\r\n1\tfruit\tapple\tgreen\r\n', resp.content)
+
+    def test_nested(self):
+        resp = self.client.get('/api/expressive.csv', HTTP_AUTHORIZATION=self.auth_string)
+        self.assertEquals('title,content,comments\r\nfoo,bar,"[{""content"":""baz""}]"\r\n',
+                          resp.content)
+
+    def test_dotted(self):
+        from piston.emitters import Emitter
+        from piston.handler import typemapper
+
+        emitter, ct = Emitter.get('csv')
+        data = [ { 'a': 1, 'b': { 'c': True, 'd': None } } ]
+
+        setattr(settings, 'PISTON_CSV_FLATTEN', 'dotted')
+        try:
+            self.assertEquals('a,b.c,b.d\r\n1,true,\r\n',
+                              emitter(data, typemapper, None).render())
+        finally:
+            del settings.PISTON_CSV_FLATTEN
+
+    def test_streamed(self):
+        from test_project.apps.testapp.urls import list_fields
+
+        expected = self.client.get('/api/list_fields', { 'format': 'csv' }).content
+
+        setattr(settings, 'PISTON_STREAM_CHUNK_SIZE', 1)
+        list_fields.stream = True
+        try:
+            resp = self.client.get('/api/list_fields', { 'format': 'csv' })
+        finally:
+            list_fields.stream = False
+            del settings.PISTON_STREAM_CHUNK_SIZE
+
+        self.assertEquals(expected, resp.content)
+
+class ColumnarEmitterTests(MainTests):
+    def init_delegate(self):
+        ListFieldsModel(kind='fruit', variety='apple', color='green').save()
+        ListFieldsModel(kind='vegetable', variety='carrot', color='orange').save()
+
+    def test_queryset(self):
+        resp = self.client.get('/api/list_fields', { 'format': 'columnar' })
+
+        self.assertEquals('application/json; charset=utf-8', resp['Content-Type'])
+        self.assertEquals({ 'columns': [ 'id', 'variety' ],
+                            'data': { 'id': [ 1, 2 ], 'variety': [ 'apple', 'carrot' ] } },
+                          simplejson.loads(resp.content))
+
+    def test_rows(self):
+        from piston.emitters import Emitter
+        from piston.handler import typemapper
+
+        emitter, ct = Emitter.get('columnar')
+        data = [ { 'a': 1, 'b': 2.5 }, { 'a': 2, 'c': u'x' } ]
+
+        self.assertEquals({ 'columns': [ 'a', 'b', 'c' ],
+                            'data': { 'a': [ 1, 2 ], 'b': [ 2.5, None ], 'c': [ None, 'x' ] } },
+                          simplejson.loads(emitter(data, typemapper, None).render()))
+
+    def test_binary(self):
+        import array, struct, sys
+        from piston.emitters import Emitter
+        from piston.handler import typemapper
+
+        emitter, ct = Emitter.get('columnar-binary')
+        data = [ { 'small': n, 'big': n * 1000, 'float': n / 2.0, 'label': str(n) }
+                 for n in range(5) ]
+
+        content = emitter(data, typemapper, None).render()
+        length = struct.unpack('<I', content[:4])[0]
+        header = simplejson.loads(content[4:4 + length])
+        body = content[4 + length:]
+
+        self.assertEquals('application/x-piston-columnar', ct)
+        self.assertEquals(0, (4 + length) % 8)
+        self.assertEquals(5, header['length'])
+        self.assertEquals({ 'label': [ '0', '1', '2', '3', '4' ] }, header['data'])
+
+        for column, kind, code in (('small', 'int8', 'b'), ('big', 'int16', 'h'),
+                                   ('float', 'float64', 'd')):
+            layout = header['arrays'][column]
+            values = array.array(code)
+            start = layout['offset']
+
+            self.assertEquals(kind, layout['type'])
+            self.assertEquals(0, start % values.itemsize)
+
+            values.fromstring(body[start:start + layout['length'] * values.itemsize])
+
+            if sys.byteorder == 'big':
+                values.byteswap()
+
+            self.assertEquals([ row[column] for row in data ], values.tolist())
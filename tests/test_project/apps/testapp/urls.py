@@ -50,7 +50,7 @@ urlpatterns = patterns('',
     url(r'^oauth/access_token$', 'piston.authentication.oauth_access_token'),
 
     url(r'^list_fields$', list_fields),
-    url(r'^list_fields/(?P<id>.+)$', list_fields),
+    url(r'^list_fields/(?P<id>.+)$', list_fields, name='list_fields'),
     
     url(r'^popo$', popo),
 )